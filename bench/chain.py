@@ -0,0 +1,65 @@
+#Microbenchmark of the per-item overhead of a MicroFlow: chains of light tasks
+#of different lengths are run over the same items in a single process, and
+#the difference between the longest and the shortest chain gives the time that
+#one more task adds to each item - mostly the interpreter overhead of calling
+#it, since the tasks themselves do next to nothing
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'muFlow'))
+import assembler as asm
+import baseTasks as bt
+import progress
+
+class Increment(bt.BaseParallel):
+  inputs = ['items']
+  outputs = ['items']
+  def action(self, x):
+    return x + 1
+
+class Split(bt.BaseParallel):
+  inputs = ['items']
+  outputs = ['items', 'others']
+  def action(self, x):
+    return x, x
+
+class Join(bt.BaseParallel):
+  inputs = ['items', 'others']
+  outputs = ['items']
+  def action(self, x, y):
+    return x + y
+
+def run(items, length):
+  #time of processing the items by a chain of the given number of tasks
+  parent = asm.MacroFlow()
+  parent.scope = {'items': items}
+  micro = asm.MicroFlow(parent, num_proc=1)
+  for i in range(length):
+    if i % 4 == 2:
+      micro.append(Split())
+    elif i % 4 == 3:
+      micro.append(Join())
+    else:
+      micro.append(Increment())
+  micro.gather('items')
+  micro.setup()
+  start = time.time()
+  micro.action(items)
+  return time.time() - start
+
+if __name__ == "__main__":
+  p = argparse.ArgumentParser(description='Per-item overhead of MicroFlow task chains')
+  p.add_argument('--items', type=int, default=200000, help='Number of items (default is 200000)')
+  p.add_argument('--tasks', type=int, default=16, help='Length of the longest chain (default is 16)')
+  p.add_argument('--repeat', type=int, default=3, help='Best of that many runs (default is 3)')
+  args = p.parse_args()
+  progress.usePrint(False)
+  items = list(range(args.items))
+  short = min(run(items, 1) for i in range(args.repeat))
+  long_ = min(run(items, args.tasks) for i in range(args.repeat))
+  per_task = (long_ - short) / (args.items * (args.tasks - 1))
+  print('chain of 1 task:   {:.3f} s'.format(short))
+  print('chain of {} tasks: {:.3f} s'.format(args.tasks, long_))
+  print('overhead per task and item: {:.3f} us'.format(per_task * 1e6))
@@ -0,0 +1,154 @@
+#Benchmark suite of the framework itself: the tasks in bench/tasks do next to
+#nothing (or exactly as much as they are told to), so the measured times are
+#those of muFlow - calling the tasks, sending the data between processes,
+#starting the MicroFlows and reducing. Every result is a time in seconds
+#(lower is better), stored under a name like 'transfer.64k' in a JSON file,
+#which can be saved as a baseline and compared with later runs.
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, '..', 'muFlow'))
+from assembler import Assembler
+
+def measure(asm, text, repeat, **kwargs):
+  #best time of executing the script (without assembling it)
+  best = None
+  for i in range(repeat):
+    flow = asm.assembleFromText(text, **kwargs)
+    start = time.time()
+    flow.execute()
+    taken = time.time() - start
+    best = taken if best is None else min(best, taken)
+  return best
+
+def benchOverhead(asm, scale, repeat):
+  #time per item of a single MicroFlow, and what one more task adds to it
+  count = 100000 // scale
+  short = measure(asm, ['range {}'.format(count), 'noop', 'sink'], repeat, num_proc=1)
+  long_ = measure(asm, ['range {}'.format(count)] + ['noop'] * 9 + ['sink'], repeat, num_proc=1)
+  return {
+    'overhead.item': short / count,
+    'overhead.task_item': (long_ - short) / (count * 8),
+  }
+
+def benchStartup(asm, scale, repeat):
+  #time of starting the worker processes, and of running a MicroFlow on them
+  count = 200 // scale
+  single = measure(asm, ['range 1', 'noop', 'sink'], repeat)
+  many = measure(asm, ['range 1'] + ['noop', 'sink'] * count, repeat)
+  return {
+    'startup.pool': single,
+    'startup.microflow': many / count,
+  }
+
+def benchTransfer(asm, scale, repeat):
+  #time per megabyte of sending items of various sizes to a process and back
+  results = {}
+  total = (64 << 20) // scale
+  for name, size in (('1k', 1 << 10), ('64k', 64 << 10), ('1m', 1 << 20), ('4m', 4 << 20)):
+    count = max(1, total // size)
+    taken = measure(asm, ['blobs {} {}'.format(count, size), 'noop', 'sink'], repeat, num_proc=1)
+    results['transfer.' + name] = taken / (count * size / float(1 << 20))
+  return results
+
+def benchScaling(asm, scale, repeat):
+  #strong scaling: the same work on more processes; weak scaling: the work
+  #grows with the number of processes
+  results = {}
+  count = 2000 // scale
+  procs = [1]
+  while procs[-1] * 2 <= mp.cpu_count():
+    procs.append(procs[-1] * 2)
+  for num_proc in procs:
+    strong = ['range {}'.format(count), 'spin 200', 'sink']
+    weak = ['range {}'.format(count * num_proc), 'spin 200', 'sink']
+    results['scaling.strong.{}'.format(num_proc)] = measure(asm, strong, repeat, num_proc=num_proc)
+    results['scaling.weak.{}'.format(num_proc)] = measure(asm, weak, repeat, num_proc=num_proc)
+  return results
+
+def benchReducer(asm, scale, repeat):
+  #time per item of reducing, by the parent and by the workers in pairs
+  count = 200000 // scale
+  text = ['range {}'.format(count), 'reduce_add']
+  return {
+    'reducer.flat': measure(asm, text, repeat) / count,
+    'reducer.tree': measure(asm, text, repeat, tree_reduce=True) / count,
+  }
+
+BENCHMARKS = [
+  ('overhead', benchOverhead),
+  ('startup', benchStartup),
+  ('transfer', benchTransfer),
+  ('scaling', benchScaling),
+  ('reducer', benchReducer),
+]
+
+def compare(results, baseline, tolerance):
+  #prints the results against the baseline and returns the names of those
+  #that got slower by more than the tolerance (a fraction)
+  regressions = []
+  for name in sorted(results.keys()):
+    if name not in baseline:
+      print('{:24} {:12.3e}'.format(name, results[name]))
+      continue
+    ratio = results[name] / baseline[name] if baseline[name] > 0 else 1.0
+    flag = ''
+    if ratio > 1.0 + tolerance:
+      flag = '  REGRESSION'
+      regressions.append(name)
+    print('{:24} {:12.3e} {:12.3e} {:7.2f}x{}'.format(name, results[name], baseline[name], ratio, flag))
+  return regressions
+
+if __name__ == "__main__":
+  p = argparse.ArgumentParser(description='muFlow benchmark suite')
+  p.add_argument('--only', action='append', default=[], metavar='NAME',
+      help='Run only the given benchmark (can be given multiple times): ' +
+      ', '.join(name for name, _ in BENCHMARKS))
+  p.add_argument('--quick', action='store_true', help='Use 10x less work, for a rough check')
+  p.add_argument('--repeat', type=int, default=3, help='Best of that many runs (default is 3)')
+  p.add_argument('--output', type=str, default=None, metavar='FILE', help='Write the results to this file')
+  p.add_argument('--save', type=str, default=None, metavar='FILE', help='Save the results as a baseline')
+  p.add_argument('--compare', type=str, default=None, metavar='FILE',
+      help='Compare the results with a baseline, failing if any got slower than the tolerance')
+  p.add_argument('--tolerance', type=float, default=0.2,
+      help='Slowdown allowed before a result counts as a regression (default is 0.2, i.e. 20%%)')
+  args = p.parse_args()
+
+  asm = Assembler(os.path.join(BENCH_DIR, 'tasks'))
+  asm.preventVT100()
+  asm.preventLogging()
+  scale = 10 if args.quick else 1
+  results = {}
+  for name, bench in BENCHMARKS:
+    if len(args.only) == 0 or name in args.only:
+      results.update(bench(asm, scale, args.repeat))
+  report = {
+    'machine': {
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'cpu_count': mp.cpu_count(),
+    },
+    'quick': args.quick,
+    'results': results,
+  }
+  for path in (args.output, args.save):
+    if path is not None:
+      with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True)
+  if args.compare is None:
+    print(json.dumps(report, indent=2, sort_keys=True))
+  else:
+    with open(args.compare, 'r') as baseline_file:
+      baseline = json.load(baseline_file)
+    if baseline.get('quick') != args.quick:
+      print('Warning: the baseline was made with a different --quick setting')
+    regressions = compare(results, baseline['results'], args.tolerance)
+    if len(regressions) > 0:
+      print('{} regression(s): {}'.format(len(regressions), ', '.join(regressions)))
+      sys.exit(1)
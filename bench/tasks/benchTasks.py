@@ -0,0 +1,54 @@
+import time
+
+from baseTasks import BaseProcessor, BaseParallel, BaseReducer
+
+class BenchRange(BaseProcessor):
+  name = 'range'
+  info = 'Outputs a list of numbers 0..(count-1)'
+  params = [('count', int)]
+  outputs = ['item']
+  def action(self):
+    return list(range(self.count))
+
+class BenchBlobs(BaseProcessor):
+  name = 'blobs'
+  info = 'Outputs a list of given number of byte strings of given size'
+  params = [('count', int), ('size', int)]
+  outputs = ['item']
+  def action(self):
+    return [bytearray(self.size) for i in range(self.count)]
+
+class BenchSink(BaseProcessor):
+  name = 'sink'
+  info = 'Consumes its input, forcing a MicroFlow to gather it'
+  inputs = ['item']
+  def action(self, item):
+    pass
+
+class BenchNoop(BaseParallel):
+  name = 'noop'
+  info = 'Returns its input as it is'
+  inputs = ['item']
+  outputs = ['item']
+  def action(self, item):
+    return item
+
+class BenchSpin(BaseParallel):
+  name = 'spin'
+  info = 'Keeps the CPU busy for a given number of microseconds per item'
+  params = [('micros', int)]
+  inputs = ['item']
+  outputs = ['item']
+  def action(self, item):
+    end = time.time() + self.micros * 1e-6
+    while time.time() < end:
+      pass
+    return item
+
+class BenchAdd(BaseReducer):
+  name = 'add'
+  info = 'Sums the items up'
+  inputs = ['item']
+  outputs = ['item']
+  def reduction(self, a, b):
+    return a + b
@@ -1,15 +1,48 @@
-import importlib
-import inspect
 import multiprocessing as mp
 import os
 import sys
+import threading
+import time
+import traceback
 from copy import copy
 
 import baseTasks
+import cache
+import checkpoint
+import columns
 import muparse
+import optimizer
+import pipeline
 import progress
+import scheduler
+import spill
+import taskindex
+import tracing
+import transport
+import workers
 from errors import *
 
+#####Python 2 and 3 compatibility#####
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+#####Optional dependencies#####
+try:
+  import numpy
+except ImportError:
+  numpy = None
+try:
+  from concurrent import futures
+except ImportError:
+  futures = None
+#coroutine actions need Python 3.5+
+if sys.version_info >= (3, 5):
+  import asyncRunner
+else:
+  asyncRunner = None
+
 class Assembler(object):
   taskFolder = 'tasks/'
   tasks_serial = {}
@@ -27,49 +60,43 @@ class Assembler(object):
     self.__importTasks(self.taskFolder)
 
   def __importTasks(self, path):
-    if not path.endswith('/'): path += '/'
-    #scan the folder for modules
-    module_names = []
-    for module in os.listdir(path):
-      if os.path.isfile(path + module) and module.endswith('.py'):
-        module_names.append( module.split('.')[0] )
-    #import each and extract all the non-base classes that derive from BaseProcessor
+    #the tasks are looked up in the index of the folder - their modules are
+    #only imported once a script uses them (or when the index is outdated)
     sys.path.append(path)
-    for module in module_names:
-      tmod = importlib.import_module(module)
-      for name, obj in inspect.getmembers(tmod, inspect.isclass):
-        if (issubclass(obj, baseTasks.BaseProcessor) and not obj.isBase):
-          try:
-            if not obj.isValid:
-              obj.validateParams()
-          except baseTasks.BadParamException as e:
-            print(e.message + ' - skipping import')
-          else:
-            #add a string attribute identifying which module did the task come from
-            obj.module = module
-            #any task that reached this point is good to go, regardless of what kind it was
-            #but now it matters whether it's parallel or serial
-            if issubclass(obj, baseTasks.BaseParallel):
-              self.tasks_parallel[obj.name] = obj
-            elif issubclass(obj, baseTasks.BaseReducer):
-              self.tasks_reducer[obj.name] = obj
-            else:
-              self.tasks_serial[obj.name] = obj
+    for record in taskindex.TaskIndex(path).scan():
+      if record.kind == 'parallel':
+        self.tasks_parallel[record.name] = record
+      elif record.kind == 'reducer':
+        self.tasks_reducer[record.name] = record
+      else:
+        self.tasks_serial[record.name] = record
+
+  def runWorker(self, address, authkey):
+    #serves as a remote worker of the coordinator at the given address, until
+    #it is done with the script; the tasks are taken from this Assembler's
+    #folder, which should hold the same tasks as that of the coordinator
+    conn, (lines, options) = workers.connect(address, authkey)
+    try:
+      flow = self.assembleFromText(lines, **options)
+      flow.serve(conn)
+    except muException as e:
+      conn.send(('error', e.message))
+    finally:
+      conn.close()
 
   def printTaskDetails(self, task):
-    s = lambda x: str(x).split("'")[1]
     print('\t{}'.format(task.info))
     print('\tParams:  {}'.format(len(task.params)))
     if len(task.params) > 0:
       for param in task.params:
-        if type(param[1]) is not baseTasks.MuEnum:
+        if type(param[1]) is not list:
           print('\t\t{:10}{}{}'.format(
             param[0],
-            s(param[1]),
+            param[1],
             '' if len(param) < 3 else ', default = {}'.format(param[2])
           ))
         else:
-          print('\t\t{:10}ENUM: "{}"'.format(param[0], '", "'.join(param[1].keys())))
+          print('\t\t{:10}ENUM: "{}"'.format(param[0], '", "'.join(param[1])))
           if len(param) == 3:
             print('\t\t{:10}{}'.format('', 'default = "{}"'.format(param[2])))
     print('\tInputs:  {}, default: {}'.format(len(task.inputs), ', '.join(task.inputs)))
@@ -117,9 +144,12 @@ class Assembler(object):
   def preventLogging(self):
     progress.usePrint(False)
 
-  def assembleFromText(self, lines, num_proc=0, debug=False):
+  def assembleFromText(self, lines, num_proc=0, debug=False, optimize=False, **kwargs):
     #parses the given text line by line, constructing tasks from them
-    flow = MacroFlow(num_proc=num_proc, debug=debug)
+    #optionally reorders them and drops the needless ones (see optimizer)
+    #any additional keyword arguments are execution options for the MacroFlow
+    flow = MacroFlow(num_proc=num_proc, debug=debug, **kwargs)
+    tasks = []
     for n, line in enumerate(lines):
       #parse the line into a dict of construction information
       #(task name, input/output arguments, parameters)
@@ -131,30 +161,91 @@ class Assembler(object):
       #try to find the task in the task lists, starting from parallel
       if taskName in self.tasks_parallel.keys():
         taskClass = self.tasks_parallel[taskName]
-        taskObject = taskClass(**taskData)
-        flow.appendParallel(taskObject)
+        tasks.append(('parallel', taskClass(**taskData)))
       elif taskName in self.tasks_serial.keys():
         taskClass = self.tasks_serial[taskName]
-        taskObject = taskClass(**taskData)
-        flow.appendSerial(taskObject)
+        tasks.append(('serial', taskClass(**taskData)))
       elif taskName in self.tasks_reducer.keys():
         taskClass = self.tasks_reducer[taskName]
-        taskObject = taskClass(**taskData)
-        flow.appendReducer(taskObject)
+        tasks.append(('reducer', taskClass(**taskData)))
       else:
         raise ConstructException('line {}: '.format(n), 'no such task!')
+    if optimize:
+      tasks, flow.dropped = optimizer.optimize(tasks, keep=flow.keep)
+    #remote workers assemble the same script (see MacroFlow.serve)
+    options = dict((key, value) for key, value in kwargs.items() if key in MacroFlow.worker_options)
+    flow.script = (list(lines), dict(options, debug=debug, optimize=optimize))
+    for kind, taskObject in tasks:
+      if kind == 'parallel':
+        flow.appendParallel(taskObject)
+      elif kind == 'serial':
+        flow.appendSerial(taskObject)
+      else:
+        flow.appendReducer(taskObject)
     flow.completeParallel() #ensure the parallel tasks are assembled
+    flow.analyzeScope()
     return flow
 
 class MacroFlow(object):
-  def __init__(self, num_proc=0, debug=False):
+  #options that affect how the MicroFlows are assembled and run by the
+  #workers, which remote workers therefore need to know
+  worker_options = ('schedule', 'stream_size', 'keep', 'tree_reduce', 'backend', 'threads',
+                    'in_flight', 'columnar', 'codec')
+
+  def __init__(self, num_proc=0, debug=False, schedule='static', stream_size=256,
+               concurrent=False, free_dead=False, keep=(), cache_dir=None,
+               cache_size=1<<30, checkpoint_dir=None, resume=False, tree_reduce=False,
+               trace_file=None, backend='process', threads=0, in_flight=64, columnar=False,
+               codec=None, spill_dir=None, memory_budget=None, remote=None, remote_workers=1,
+               authkey=None, pipeline=False, pipeline_depth=16):
     self.debug = debug
     self.tasks = [] #tasks are executed in order
     self.scope = {} #place where the intermediate results are contained
     self.micros = []      #potential outputs of MicroFlows; list of tuples
     self.parallel = None  #MicroFlow object during construction
     self.num_proc = num_proc
+    self.schedule = schedule  #how MicroFlows distribute the work among processes
+    self.stream_size = stream_size  #max number of items processes send back at once
+    self.tree_reduce = tree_reduce  #processes combine their reductions pairwise
+    self.backend = backend  #what MicroFlows run on, unless their tasks say otherwise
+    self.threads = threads  #number of threads of the thread and hybrid backends
+    self.in_flight = in_flight  #items processed at once by coroutine actions
+    self.columnar = columnar  #MicroFlows store numeric outputs in arrays
+    self.codec = codec  #how the data is serialized for the processes
     self.deferred = []    #serial reducers to be added after the MicroFlow
+    self.pool = None      #worker processes shared by all MicroFlows, during execution
+    self.concurrent = concurrent  #run independent tasks at the same time
+    self.free_dead = free_dead  #release scope items once no task needs them
+    self.keep = set(keep)       #final outputs that are never released
+    self.dropped = []  #tasks dropped by the optimizer, as (kind, task) tuples
+    self.lifetimes = None #readers of each value in the scope (see analyzeScope)
+    #results of tasks can be stored on disk and reused by later runs
+    self.cache = None if cache_dir is None else cache.ResultCache(cache_dir, cache_size)
+    #progress can be persisted, so that an interrupted run can be resumed
+    self.checkpoint = None
+    if checkpoint_dir is not None:
+      self.checkpoint = checkpoint.Checkpoint(checkpoint_dir)
+    self.resume = resume
+    #spans of time spent on tasks and transfers can be saved for inspection
+    self.trace_file = trace_file
+    self.trace = None if trace_file is None else tracing.Trace()
+    #large items can be moved to disk when the scope outgrows the memory
+    self.spiller = None
+    if spill_dir is not None:
+      self.spiller = spill.Spiller(spill_dir, memory_budget)
+    #instead of starting processes, MicroFlows can be run by workers that
+    #connect to the given address ('host:port'), from this or other machines
+    #(see workers.RemotePool) - the script has to be assembled from text
+    self.remote = remote
+    self.remote_workers = remote_workers
+    self.authkey = authkey
+    self.script = None  #lines and options of the script (see assembleFromText)
+    #a streaming serial task right after a MicroFlow runs along with it,
+    #reading the outputs through a queue of that many parts (see pipeline)
+    self.pipeline = pipeline
+    self.pipeline_depth = pipeline_depth
+    if remote is not None and authkey is None:
+      raise ConstructException('MacroFlow', 'remote workers require an authentication key')
   
   def checkItem(self, item):
     # if it already is in scope - we're good
@@ -198,7 +289,15 @@ class MacroFlow(object):
       #we're only starting to construct a parallelized task set
       self.parallel = MicroFlow(parent=self,
                                 num_proc=self.num_proc,
-                                debug=self.debug
+                                debug=self.debug,
+                                schedule=self.schedule,
+                                stream_size=self.stream_size,
+                                tree_reduce=self.tree_reduce,
+                                backend=self.backend,
+                                threads=self.threads,
+                                in_flight=self.in_flight,
+                                columnar=self.columnar,
+                                codec=self.codec
       )
     self.parallel.append(task, isReducer)
   
@@ -229,47 +328,394 @@ class MacroFlow(object):
         self.appendSerial(serial)
       self.deferred = []
   
+  def analyzeScope(self):
+    #liveness analysis of the scope: for every value that an item takes during
+    #execution, find the tasks that read it - once all of them have run, the
+    #value is dead and can be released (unless the item is a final output)
+    #values that no task reads are results of the script and are kept, while
+    #those overwritten by the task reading them (in-place) are just replaced
+    self.lifetimes = []
+    readers = {}  #readers of the current value of each item
+    for i, task in enumerate(self.tasks):
+      for item in task.getInputs():
+        readers.setdefault(item, []).append(i)
+      for item in task.getOutputs():
+        if item in readers:
+          previous = readers.pop(item)
+          if i not in previous:
+            self.lifetimes.append((item, previous))
+    self.lifetimes += list(readers.items())
+    self.lifetimes = [(item, set(tasks)) for item, tasks in self.lifetimes if item not in self.keep]
+
+  def printPlan(self):
+    #prints the tasks in order of execution, with the contents of MicroFlows
+    def line(task, kind=None):
+      return '{} ({} > {}){}'.format(task.name, ', '.join(task.getInputs()),
+                                     ', '.join(task.getOutputs()),
+                                     '' if kind is None else ' [{}]'.format(kind))
+    for i, task in enumerate(self.tasks):
+      if isinstance(task, MicroFlow):
+        print('{:3}  MicroFlow ({} > {})'.format(i, ', '.join(task.getInputs()),
+                                                 ', '.join(task.getOutputs())))
+        for subtask in task.tasks:
+          print('       ' + line(subtask, 'reducer' if subtask in task.reducers else None))
+      else:
+        print('{:3}  '.format(i) + line(task))
+    for kind, task in self.dropped:
+      print('  -  ' + line(task, 'dropped'))
+
+  def completeTask(self, alive, index, restored=False):
+    #bookkeeping after the task of given index is done (or restored from
+    #the checkpoint of a previous run)
+    #an iterator can only be read once, so if more tasks read it, it is
+    #turned into a list right away
+    for item in self.tasks[index].getOutputs():
+      if isIterator(self.scope.get(item)) and len(self.__readers(item, index)) > 1:
+        self.scope[item] = list(self.scope[item])
+    if self.checkpoint is not None and not restored:
+      outputs = self.tasks[index].getOutputs()
+      self.checkpoint.save(index, dict((key, self.scope[key]) for key in outputs))
+    self.releaseDead(alive, index)
+    #the results just stored may have made the cache exceed its size
+    if self.cache is not None:
+      self.cache.trim()
+    if self.spiller is not None:
+      self.spiller.enforce(self.scope)
+
+  def releaseDead(self, alive, index):
+    #marks the task of given index as done and drops the values that died with it
+    for lifetime in list(alive):
+      item, readers = lifetime
+      readers.discard(index)
+      if len(readers) == 0:
+        self.scope.pop(item, None)
+        alive.remove(lifetime)
+
+  def getDependencies(self):
+    #for each task, lists the earlier tasks it has to wait for: those which
+    #produce its inputs, consume its outputs, or also produce its outputs
+    dependencies = []
+    for i, task in enumerate(self.tasks):
+      inputs, outputs = set(task.getInputs()), set(task.getOutputs())
+      dependencies.append([
+        j for j, earlier in enumerate(self.tasks[:i])
+        if set(earlier.getOutputs()) & (inputs | outputs) or set(earlier.getInputs()) & outputs
+      ])
+    return dependencies
+
+  def runTask(self, task, streams={}):
+    start = time.time()
+    #query the task for its required inputs and retrieve their values from the scope
+    #(or the streams, for a streaming task in a pipeline)
+    inputs = [streams[i] if i in streams else self.scope[i] for i in task.getInputs()]
+    #look for the results of an identical run in the cache
+    #(tasks without outputs are only run for their side effects)
+    key, found = None, False
+    if (self.cache is not None and task.cacheable and len(streams) == 0 and
+        len(task.getOutputs()) > 0):
+      if isinstance(task, MicroFlow):
+        signature = task.signature(self.cache)
+      else:
+        signature = self.cache.signature(task)
+      key = self.cache.key(signature, inputs)
+      if key is not None:
+        found, results = self.cache.get(key)
+    #otherwise feed them to the task and run it
+    if not found:
+      results = task.action(*inputs)
+      if key is not None:
+        self.cache.put(key, results)
+    #pack the output back to the scope
+    #mind that if a task returns multiple items, they are automatically packed into
+    #a tuple, while a single item is packed as is and should not be iterated over
+    outputs = task.getOutputs()
+    for result, key in zip(results if len(outputs) > 1 else (results,), outputs):
+      self.scope[key] = result
+    if self.trace is not None:
+      self.trace.add(task.name, 'task', start, time.time(), cached=found)
+
   def execute(self):
     #measure time and print reports using external object
     reporter = progress.SerialReporter()
     #start with setting up each task
     reporter.start('Setting up...')
     try:
-      for task in self.tasks:
-        task.setup()
+      with tracing.Span(self.trace, 'setup', 'task'):
+        for task in self.tasks:
+          task.setup()
     except baseTasks.muException as e:
       e.die()
+    #start the worker processes once for all the MicroFlows - this happens
+    #after the setup so that the workers inherit the prepared tasks
+    micros = [task for task in self.tasks if isinstance(task, MicroFlow)]
+    if any(micro.backend != 'thread' for micro in micros):
+      if self.remote is not None:
+        if self.script is None:
+          raise ConstructException('MacroFlow', 'only scripts assembled from text can run remotely')
+        reporter.start('Waiting for {} worker(s) at {}...'.format(self.remote_workers, self.remote))
+        self.pool = workers.RemotePool(micros, self.remote, self.remote_workers, self.authkey,
+                                       self.script)
+      else:
+        self.pool = workers.WorkerPool(micros, micros[0].num_proc)
     reporter.stop()
-    #execute the task list in order
-    for task in self.tasks:
-      reporter.start('Task: ' + task.name)
-      #query each task for its required inputs and retrieve their values from the scope
-      inputs = [self.scope[i] for i in task.getInputs()]
-      #feed them to the task and run it
-      results = task.action(*inputs)
-      #pack the output back to the scope
-      #mind that if a task returns multiple items, they are automatically packed into
-      #a tuple, while a single item is packed as is and should not be iterated over
-      outputs = task.getOutputs()
-      for result, key in zip(results if len(outputs) > 1 else (results,), outputs):
-        self.scope[key] = result
-      reporter.stop()
+    #values still waiting for their readers, if they are to be released at all
+    alive = []
+    if self.free_dead:
+      if self.lifetimes is None:
+        self.analyzeScope()
+      alive = [(item, set(readers)) for item, readers in self.lifetimes]
+    try:
+      #tasks completed by a previous run only have their outputs restored
+      done = []
+      if self.checkpoint is not None:
+        done = self.checkpoint.start(self.tasks, resume=self.resume)
+        for i in done:
+          self.scope.update(self.checkpoint.restore(i))
+        for i in done:
+          self.completeTask(alive, i, restored=True)
+      if self.concurrent:
+        self.__executeConcurrent(alive, done)
+      else:
+        #execute the task list in order
+        streamed = set()
+        for i, task in enumerate(self.tasks):
+          if i in done or i in streamed:
+            continue
+          consumer = self.__streamingConsumer(i, done) if self.pipeline else None
+          if consumer is not None:
+            reporter.start('Tasks: {} streaming into {}'.format(task.name, consumer.name))
+            self.__runPipelined(task, consumer)
+            self.completeTask(alive, i)
+            self.completeTask(alive, i + 1)
+            streamed.add(i + 1)
+          else:
+            reporter.start('Task: ' + task.name)
+            self.runTask(task)
+            self.completeTask(alive, i)
+          reporter.stop(task.summary() if isinstance(task, MicroFlow) else None)
+    except BaseException:
+      #workers could be stuck in the middle of a MicroFlow
+      if self.pool is not None:
+        self.pool.terminate()
+        self.pool = None
+      raise
+    finally:
+      #whatever was recorded, also of a failed run
+      if self.trace is not None:
+        self.trace.save(self.trace_file)
+    if self.pool is not None:
+      self.pool.close()
+      self.pool = None
     reporter.total('Done!')
     return self.scope
 
+  def __streamingConsumer(self, index, done):
+    #the task that can stream the outputs of the task of given index, if any:
+    #a streaming serial task reading some of the outputs of the MicroFlow
+    #right before it
+    if index + 1 >= len(self.tasks) or index + 1 in done:
+      return None
+    task, consumer = self.tasks[index], self.tasks[index + 1]
+    if not isinstance(task, MicroFlow) or isinstance(consumer, MicroFlow):
+      return None
+    if not getattr(consumer, 'streaming', False):
+      return None
+    if not any(item in task.getOutputs() for item in consumer.getInputs()):
+      return None
+    return consumer
+
+  def __runPipelined(self, micro, consumer):
+    #runs the MicroFlow in a thread, while the consumer reads its outputs as
+    #they come; outputs that no other task needs are not even kept
+    index = self.tasks.index(consumer)
+    items = [item for item in consumer.getInputs() if item in micro.getOutputs()]
+    stream = pipeline.Stream(items, self.pipeline_depth)
+    discarded = set()
+    if self.checkpoint is None:
+      for item in items:
+        if item not in self.keep and len(self.__readers(item, index)) == 0:
+          discarded.add(item)
+    micro.stream, micro.discarded = stream, discarded
+    errors = []
+    def produce():
+      try:
+        self.runTask(micro)
+      except BaseException as e:
+        errors.append(e)
+      finally:
+        stream.close()
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+    try:
+      self.runTask(consumer, dict((item, stream.iterate(item)) for item in items))
+      stream.drain()
+    except BaseException:
+      stream.abandon()
+      raise
+    finally:
+      producer.join()
+      micro.stream, micro.discarded = None, set()
+    if len(errors) > 0:
+      raise errors[0]
+    for item in discarded:
+      if item not in consumer.getOutputs():
+        self.scope.pop(item, None)
+
+  def __readers(self, item, index):
+    #indices of the later tasks which read the value the item has after the
+    #task of given index (before it is overwritten)
+    readers = []
+    for i in range(index + 1, len(self.tasks)):
+      task = self.tasks[i]
+      if item in task.getInputs():
+        readers.append(i)
+      if item in task.getOutputs():
+        break
+    return readers
+
+  def serve(self, conn):
+    #runs the MicroFlows as a remote worker of a coordinator which assembled
+    #the same script, over the given connection (see workers.RemotePool)
+    micros = [task for task in self.tasks if isinstance(task, MicroFlow)]
+    for micro in micros:
+      micro.setup()
+    conn.send(('ready',))
+    workers.serveJobs(conn, micros)
+
+  def __executeConcurrent(self, alive, done):
+    #runs each task in its own thread, as soon as all the tasks it depends on
+    #are complete; MicroFlows that become ready at the same time divide the
+    #worker processes among themselves
+    waiting = dict(
+      (i, set(deps) - set(done)) for i, deps in enumerate(self.getDependencies()) if i not in done
+    )
+    finished = queue.Queue()
+    def run(i):
+      task = self.tasks[i]
+      reporter = progress.SerialReporter()
+      reporter.start('Task: ' + task.name)
+      try:
+        self.runTask(task)
+      except BaseException as e:
+        finished.put((i, e))
+      else:
+        reporter.stop(task.summary() if isinstance(task, MicroFlow) else None)
+        finished.put((i, None))
+    #reports of concurrent tasks interleave, so they cannot overwrite lines
+    vt100 = progress.VT100_FLAG
+    progress.useVT100(False)
+    try:
+      running = 0
+      while len(waiting) > 0 or running > 0:
+        ready = sorted(i for i, deps in waiting.items() if len(deps) == 0)
+        micros = [i for i in ready if isinstance(self.tasks[i], MicroFlow)]
+        for i in ready:
+          del waiting[i]
+          if i in micros and self.pool is not None:
+            self.tasks[i].share = max(1, len(self.pool.pipes) // len(micros))
+          thread = threading.Thread(target=run, args=(i,))
+          thread.daemon = True
+          thread.start()
+          running += 1
+        i, error = finished.get()
+        running -= 1
+        if error is not None:
+          raise error
+        self.completeTask(alive, i)
+        for deps in waiting.values():
+          deps.discard(i)
+    finally:
+      progress.useVT100(vt100)
+
+def isIterator(value):
+  #whether the value can only be read once, like what a generator returns
+  return hasattr(value, '__next__') or hasattr(value, 'next')
+
+def placePart(results, offset, count, output, stream=None):
+  #puts a part of the outputs of a MicroFlow (values of the items from offset
+  #on) in place in the columns of results (see columns), and passes it to the
+  #stream, if any; items without a column are not kept
+  for item, values in output.items():
+    if item in results:
+      results[item].place(offset, count, values)
+  if stream is not None:
+    stream.put(offset, count, output)
+
 class MicroFlow(object):
-  def __init__(self, parent, num_proc=0, debug=False):
+  schedules = ('static', 'dynamic')
+  backends = ('process', 'thread', 'hybrid')
+
+  def __init__(self, parent, num_proc=0, debug=False, schedule='static', stream_size=256,
+               tree_reduce=False, backend='process', threads=0, in_flight=64,
+               columnar=False, codec=None):
+    if schedule not in self.schedules:
+      raise ConstructException('MicroFlow', 'unknown schedule "{}"'.format(schedule))
+    if backend not in self.backends:
+      raise ConstructException('MicroFlow', 'unknown backend "{}"'.format(backend))
+    try:
+      transport.parseCodec(codec)
+    except ValueError as e:
+      raise ConstructException('MicroFlow', str(e))
     self.name  = 'MicroFlow'
     self.debug = debug
     self.tasks = []
     self.macro = parent
     self.reducers = []
+    self.reduced  = []  #items produced by the reducers rather than per item
     self.gathered = []
     self.micro_scope = set()  #just for building phase
     self.map_requests = []  #those items aren't produced by either of the local tasks
     self.num_proc = num_proc if num_proc > 0 else mp.cpu_count()
     if self.debug:
       self.num_proc = 1
+    #static: each process receives one contiguous slice of the input
+    #dynamic: processes receive small chunks as they become free
+    self.schedule = schedule
+    #outputs are sent back to the parent in parts of at most that many items
+    self.stream_size = stream_size
+    #reductions of all the processes are either sent to the parent, which then
+    #folds them serially, or combined by the processes themselves in pairs,
+    #so that only one (fully reduced) result ever reaches the parent
+    self.tree_reduce = tree_reduce
+    #number of worker processes to use, if the pool has to be shared (see
+    #MacroFlow.execute) - by default all the workers take part
+    self.share = None
+    #with reducers, the MicroFlow can only be cached as a whole; otherwise
+    #the workers cache the results of each item (set up in setup)
+    self.cacheable = False
+    self.item_cache = None
+    #whether the tasks process the items in batches (see __runBatches)
+    self.batched = False
+    #process: the items are processed by the worker processes
+    #thread: by threads of the parent process, which costs neither forking
+    #nor pickling - best for tasks that mostly wait (e.g. for I/O)
+    #hybrid: by threads within each of the worker processes
+    #tasks may ask for a backend themselves, which takes precedence (see setup)
+    self.backend = backend
+    #threads in total (thread), or per process (hybrid); 0 means the default
+    self.threads = threads
+    #if any of the tasks' actions is a coroutine (async def), each worker
+    #runs an event loop with up to that many items in flight (see asyncRunner)
+    self.in_flight = in_flight
+    self.asynchronous = False
+    self.runner = None
+    #gathered outputs whose values are all numbers (or NumPy arrays of the
+    #same shape) are returned as arrays rather than lists (see columns)
+    self.columnar = columnar
+    #how the data sent to and from the processes is serialized (see transport);
+    #tasks may choose another codec for their outputs
+    self.codec = codec
+    self.bytes = None  #ByteCounter of the last run on the processes
+    #in a pipeline, outputs are also passed to a stream as they come, and
+    #those that are discarded are not kept at all (see MacroFlow.__runPipelined)
+    self.stream = None
+    self.discarded = set()
+    #failures of items skipped by tasks with skip_errors, as (task name,
+    #index, count, traceback) - collected in the workers as they happen, and
+    #of the last run as a whole in skipped, in order of the items
+    self.failures = []
+    self.skipped = []
 
   def __makeName(self):
     #builds a name string from tasks on the list - best call that at setup
@@ -300,6 +746,7 @@ class MicroFlow(object):
     if isReducer:
       self.reducers.append(task)
       for output in task.getOutputs():
+        self.reduced.append(output)
         self.gather(output)
   
   def getInputs(self):
@@ -321,37 +768,210 @@ class MicroFlow(object):
     #task list is complete so we can construct the name string
     self.__makeName()
     self.reporter = progress.ParallelReporter('Task: ' + self.name)
-    self.pipes = []
-    self.pool = []
-    for i in range(self.num_proc):
-      a, b = mp.Pipe(True)  #duplex pipe - we send data and receive results
-      self.pipes.append(a)
-      self.pool.append(
-        mp.Process(target=self.sequence, args=(b,) if i > 0 else (b,self.reporter))
-      )
     #setup the parallel tasks
     for task in self.tasks:
       task.setup()
+    self.asynchronous = asyncRunner is not None and any(asyncRunner.isAsync(task) for task in self.tasks)
+    #decide how the results are to be cached, if at all
+    #(items in flight are not cached one by one, and tasks without outputs
+    #are only run for their side effects)
+    cache = self.macro.cache
+    if cache is not None and all(task.cacheable and len(task.getOutputs()) > 0
+                                 for task in self.tasks):
+      if len(self.reducers) > 0:
+        self.cacheable = True
+      elif not self.asynchronous:
+        self.item_cache = cache
+        self.item_signature = cache.key(self.signature(cache))
+    #items are processed batch by batch if any task can make use of that,
+    #unless they are to be cached one by one, or run as coroutines
+    if self.item_cache is None and not self.asynchronous:
+      self.batched = any(hasattr(task, 'action_batch') for task in self.tasks)
+    self.__chooseBackend()
+    self.__compile()
+    self.__groupCodecs()
+
+  def __groupCodecs(self):
+    #the outputs streamed back are grouped by the codec of the task that
+    #produced them (the codec of the MicroFlow if it has none); each part
+    #is then sent in a message per group
+    groups = {}
+    for item in self.gathered:
+      if item in self.reduced:
+        continue
+      codec = self.codec
+      for task in self.tasks:
+        if item in task.getOutputs() and getattr(task, 'codec', None) is not None:
+          codec = task.codec
+      try:
+        transport.parseCodec(codec)
+      except ValueError as e:
+        raise ConstructException(self.name, str(e))
+      groups.setdefault(codec, []).append(item)
+    self.part_codecs = sorted(groups.items(), key=lambda group: str(group[0]))
+
+  def traffic(self):
+    #describes how much data the last run sent to and received from the
+    #processes, if it ran on any
+    if self.bytes is None:
+      return None
+    return '{} sent, {} received'.format(progress.formatBytes(self.bytes.sent),
+                                         progress.formatBytes(self.bytes.received))
+
+  def summary(self):
+    #the traffic of the last run, and how many items it skipped, if any
+    notes = [self.traffic()]
+    if len(self.skipped) > 0:
+      notes.append('{} item(s) skipped'.format(sum(count for _, _, count, _ in self.skipped)))
+    notes = [note for note in notes if note is not None]
+    return ', '.join(notes) if len(notes) > 0 else None
+
+  def __chooseBackend(self):
+    #the backend asked for by the tasks, if any, overrides the one of the
+    #script; tasks asking for both processes and threads get processes with
+    #threads in each of them
+    wanted = set(getattr(task, 'backend', None) for task in self.tasks) - set([None])
+    if len(wanted) == 1:
+      self.backend = wanted.pop()
+    elif len(wanted) > 1:
+      self.backend = 'hybrid'
+    #threads are only an optimization, so without concurrent.futures
+    #(Python 2) the processes have to do
+    if futures is None:
+      self.backend = 'process'
+    if self.backend == 'thread':
+      #like the default of ThreadPoolExecutor
+      self.thread_count = self.threads if self.threads > 0 else min(32, mp.cpu_count() + 4)
+    elif self.backend == 'hybrid':
+      self.thread_count = self.threads if self.threads > 0 else 4
+    else:
+      self.thread_count = 1
+    if self.debug:
+      self.thread_count = 1
+
+  def __workerCopy(self):
+    #a copy of the MicroFlow to be run by a thread: tasks are copied too, so
+    #that the threads do not share any state (e.g. reducers' accumulators)
+    worker = copy(self)
+    worker.runner = None
+    worker.tasks = []
+    worker.reducers = []
+    for task in self.tasks:
+      clone = copy(task)
+      if task in self.reducers:
+        clone.__dict__.pop('accumulator', None)
+        clone.action = clone.action_first
+        worker.reducers.append(clone)
+      worker.tasks.append(clone)
+    worker.__compile()
+    return worker
+
+  def __compile(self):
+    #translates the chain of tasks into a plan for processing a single item:
+    #every item of the local scope gets a fixed slot in a list (the inputs
+    #come first, in order of map_requests), and each step of the plan is the
+    #task's action with the slots of its inputs and output(s), so the item
+    #loop does not have to look anything up by name
+    #(an input requested by several tasks is sent as many times, and all but
+    #its first slot are left unused)
+    slots = {}
+    for i, name in enumerate(self.map_requests):
+      slots.setdefault(name, i)
+    self.slot_count = len(self.map_requests)
+    def slot(name):
+      if name not in slots:
+        slots[name] = self.slot_count
+        self.slot_count += 1
+      return slots[name]
+    def relay(task):
+      return lambda *args: task.action(*args)
+    def timed(action, step):
+      #when tracing, the time each task takes is summed up over the items
+      def run(*args):
+        start = time.time()
+        result = action(*args)
+        self.spent[step] += time.time() - start
+        return result
+      return run
+    self.plan = []
+    self.awaited = []  #whether each step's action is a coroutine
+    for task in self.tasks:
+      inputs = tuple(slot(name) for name in task.getInputs())
+      outputs = tuple(slot(name) for name in task.getOutputs())
+      if task in self.reducers:
+        #reducers replace their action after the first item
+        action = relay(task)
+      else:
+        action = task.action
+      #a single input is passed and a single output is written directly,
+      #multiple outputs are unpacked, and no outputs mean nothing is written
+      if len(inputs) == 1:
+        inputs = inputs[0]
+      if len(outputs) == 1:
+        outputs = outputs[0]
+      elif len(outputs) == 0:
+        outputs = None
+      #(the time of coroutines is not measured, as they interleave)
+      wait = self.asynchronous and asyncRunner.isAsync(task)
+      if self.macro.trace is not None and not wait:
+        action = timed(action, len(self.plan))
+      self.plan.append((action, inputs, outputs))
+      self.awaited.append(wait)
+    self.spent = [0.0] * len(self.plan)
+    self.gathered_slots = [slots[item] for item in self.gathered if item not in self.reduced]
+
+  def __runItem(self, slots, data):
+    #processes one item according to the plan, given a list of slots
+    #(reused between the items) and the item's inputs
+    slots[:len(data)] = data
+    for action, inputs, outputs in self.plan:
+      if inputs.__class__ is int:
+        result = action(slots[inputs])
+      else:
+        result = action(*[slots[i] for i in inputs])
+      if outputs.__class__ is int:
+        slots[outputs] = result
+      elif outputs is not None:
+        for i, value in zip(outputs, result):
+          slots[i] = value
+    return [slots[i] for i in self.gathered_slots]
+
+  def signature(self, cache):
+    #identifies the computation: the chain of tasks and the items connecting them
+    chain = [(cache.signature(task), task.getInputs(), task.getOutputs()) for task in self.tasks]
+    return (chain, self.map_requests, self.gathered)
 
   def action(self, *args):
-    #args are lists (assumed of equal size) which need to be cut into slices
-    #for each of the processes and sent to them as soon as they are started
-    batch_size = (len(args[0]) // self.num_proc + 1) if not self.debug else 1
-    for i in range(self.num_proc):
-      n_beg = i * batch_size
-      n_end = n_beg + batch_size
-      batch = [arg[n_beg:n_end] for arg in args]
-      self.pool[i].start()
-      self.pipes[i].send(batch)
-    #collect the outputs and wait until the processes are done
-    outputs = [pipe.recv() for pipe in self.pipes]
-    for process in self.pool:
-      process.join()
-    #merge the results
-    results = {item: [] for item in self.gathered}
+    #args are lists (assumed of equal size) or iterators, which need to be cut
+    #into chunks and sent to the processes as soon as they are started
+    #run on the processes of the parent MacroFlow, or start our own if there
+    #are none (when the MicroFlow is executed on its own)
+    #a task failing on an item fails the whole run, and the workers are
+    #stopped (by execute, for those of the MacroFlow)
+    del self.failures[:]
+    if self.backend == 'thread':
+      results = self.__runThreads(args)
+      self.bytes = None
+    else:
+      pool = self.macro.pool
+      if pool is None:
+        pool = workers.WorkerPool([self], self.num_proc)
+      try:
+        self.pipes = pool.acquire(self.share)
+        pool.run(self, self.pipes)
+        results = self.__dispatch(args, pool)
+      except BaseException:
+        if pool is not self.macro.pool:
+          pool.terminate()
+        raise
+      pool.release(self.pipes)
+      if pool is not self.macro.pool:
+        pool.close()
+    self.skipped = sorted(self.failures, key=lambda failure: failure[1])
     for item in self.gathered:
-      for output in outputs:
-        results[item] += output[item]
+      if item in self.reduced:
+        continue
+      results[item] = results[item].result() if item in results else None
     #output
     if len(self.gathered) > 1:
       return [results[key] for key in self.gathered]
@@ -359,33 +979,434 @@ class MicroFlow(object):
       return results[self.gathered[0]]
     else:
       return None
-  
-  def sequence(self, pipe, progress=None):
-    #this function is executed by each process separately
-    #start by receiving data (list of args, each being a list)
-    input_data = pipe.recv()
+
+  def __dispatch(self, args, pool):
+    #with static scheduling every process receives exactly one slice of the
+    #input; with dynamic, processes receive chunks of the input one by one,
+    #as they finish the previous ones, with the chunk size adapting to the
+    #measured time per item
+    #in debug mode, only the first item is processed
+    #parts of the outputs stored by an interrupted run are not computed again
+    #(unless there are reducers, whose state cannot be restored)
+    checkpoint, index, parts = self.macro.checkpoint, None, []
+    if checkpoint is not None and len(self.reducers) == 0:
+      index = self.macro.tasks.index(self)
+      parts = checkpoint.loadParts(index)
+    else:
+      checkpoint = None
+    source = scheduler.ChunkSource(args, limit=1 if self.debug else None,
+                                   skip=[(offset, count) for offset, count, _ in parts])
+    total = source.total
+    #inputs of unknown length (or with gaps) can only be scheduled dynamically,
+    #and so are streamed outputs - with static scheduling, the parts of all
+    #but the first worker would pile up waiting for their turn
+    static = (self.schedule == 'static' and total is not None and len(parts) == 0 and
+              self.stream is None)
+    self.bytes = transport.ByteCounter()
+    sizer = scheduler.ChunkSizer(len(self.pipes), minimum=self.in_flight if self.asynchronous else 1)
+    #the workers count the items they have done, for the progress reports
+    slots = [pool.pipes.index(pipe) for pipe in self.pipes]
+    self.reporter.setup(source.remaining(), pool.counters, slots)
+    slice_size = total // len(self.pipes) + 1 if static else None
+    #the outputs are streamed back in parts and put in place as they come,
+    #so only the final lists (and a single part) are held at a time
+    results = self.__prepareResults(total)
+    for offset, count, output in parts:
+      placePart(results, offset, count, output, self.stream)
+    def feed(pipe, first):
+      #send the next chunk to the process and return its size,
+      #or tell the process to finish if there is nothing left
+      chunk = None
+      if first or not static:
+        chunk = source.take(slice_size if static else sizer.next(source.remaining()))
+      with tracing.Span(self.macro.trace, 'send', 'transport'):
+        transport.send(pipe, chunk, self.codec, self.bytes)
+      return None if chunk is None else source.position - chunk[0]
+    working = {}
+    unsaved = {}  #parts split by codec, by offset, until all of them are here
+    gathering = [item for _, items in self.part_codecs for item in items]
+    for pipe in self.pipes:
+      working[pipe] = feed(pipe, True)
+    #processes respond with parts of the chunk's outputs, notify of completing
+    #the chunk, and finally send their reductions once they are told to finish
+    while len(working) > 0:
+      #wake up at least every second to report progress
+      self.reporter()
+      for pipe in scheduler.waitPipes(list(working.keys()), 1.0):
+        with tracing.Span(self.macro.trace, 'recv', 'transport'):
+          try:
+            message = transport.recv(pipe, self.bytes)
+          except (EOFError, IOError):
+            raise WorkerException(self.name, None, 'the worker quit unexpectedly')
+        if message[0] == 'part':
+          _, offset, count, output = message
+          placePart(results, offset, count, output, self.stream)
+          #remote workers cannot update the counters, so the items are counted
+          #here as they arrive (a part split by codec counts once)
+          if pool.remote and self.part_codecs[0][1][0] in output:
+            pool.counters[slots[self.pipes.index(pipe)]] += count
+          if checkpoint is not None:
+            #a part split by codec is stored once all of it has come
+            split = unsaved.setdefault(offset, {})
+            split.update(output)
+            if len(split) == len(gathering):
+              checkpoint.savePart(index, offset, count, unsaved.pop(offset))
+        elif message[0] == 'done':
+          if pool.remote and len(self.part_codecs) == 0:
+            pool.counters[slots[self.pipes.index(pipe)]] += working[pipe]
+          sizer.update(working[pipe], message[1])
+          if self.macro.trace is not None:
+            self.macro.trace.merge(message[2], 'muFlow worker')
+          self.failures += message[3]
+          working[pipe] = feed(pipe, False)
+        elif message[0] == 'error':
+          _, name, index, count, text = message
+          raise WorkerException(name, index, text, count)
+        else:
+          for item, values in message[1].items():
+            results[item] += values
+          del working[pipe]
+    return results
+
+  def __prepareResults(self, total):
+    #columns for the outputs gathered per item, lists for the reduced ones
+    column = columns.TypedColumn if self.columnar else columns.ListColumn
+    results = dict((item, column(total)) for item in self.gathered
+                   if item not in self.reduced and item not in self.discarded)
+    #outputs move to disk as they arrive, if they would not fit in memory
+    #along with the rest of the scope
+    spiller = self.macro.spiller
+    if spiller is not None and len(results) > 0:
+      used = sum(spill.estimateSize(value) for value in list(self.macro.scope.values()))
+      available = max(0, spiller.budget - used) // len(results)
+      for item in results:
+        results[item] = spill.SpillColumn(spiller, available, results[item])
+    for item in self.reduced:
+      results[item] = []
+    return results
+
+  def __runThreads(self, args):
+    #runs the MicroFlow on threads of this process instead of the workers:
+    #each thread has its own copy of the tasks and takes chunks of the input
+    #one by one, putting their outputs in place directly - nothing is pickled
+    #like with dynamic scheduling, the order in which the reducers receive
+    #the items is not preserved
+    source = scheduler.ChunkSource(args, limit=1 if self.debug else None)
+    results = self.__prepareResults(source.total)
+    gathering = [item for item in self.gathered if item not in self.reduced]
+    clones = [self.__workerCopy() for i in range(self.thread_count)]
+    lock = threading.Lock()
+    def emit(message):
+      _, offset, count, output = message
+      with lock:
+        placePart(results, offset, count, output, self.stream)
+    counters = [0] * len(clones)
+    self.reporter.setup(source.remaining(), counters, list(range(len(clones))))
+    size = max(self.stream_size, self.in_flight) if self.asynchronous else self.stream_size
+    #once a thread fails, the others take no more chunks
+    failed = []
+    def work(rank):
+      while len(failed) == 0:
+        with lock:
+          chunk = source.take(size)
+        if chunk is None:
+          return
+        offset, input_data = chunk
+        try:
+          with tracing.Span(self.macro.trace, 'chunk', 'parallel', items=len(input_data[0])):
+            clones[rank].__runChunk(emit, offset, input_data, gathering, (counters, rank))
+        except BaseException:
+          failed.append(rank)
+          raise
+    executor = futures.ThreadPoolExecutor(len(clones))
+    try:
+      running = [executor.submit(work, rank) for rank in range(len(clones))]
+      while len(futures.wait(running, 1.0).not_done) > 0:
+        self.reporter()
+      for future in running:
+        future.result()
+    finally:
+      executor.shutdown()
+      for clone in clones:
+        clone.__closeRunner()
+    for clone in clones:
+      for task in clone.reducers:
+        for item in task.getOutputs():
+          results[item] += task.output()
+    return results
+
+  def sequence(self, pipe, rank, inboxes, counter):
+    #this function is executed by each worker process separately
+    #it keeps receiving chunks of data (offset and list of args, each being
+    #a list) and sending back their outputs, until it receives None
+    #the number of items done so far is kept up to date in the counter (a
+    #shared array and the index of this process' slot), so that the parent
+    #can report the progress
+    #should anything fail, the traceback is sent to the parent instead,
+    #which then stops the workers
+    try:
+      self.__sequence(pipe, rank, inboxes, counter)
+    except WorkerException as e:
+      transport.send(pipe, ('error', e.taskname, e.index, e.count, e.text))
+    except Exception:
+      transport.send(pipe, ('error', self.name, None, 1, traceback.format_exc()))
+
+  def __sequence(self, pipe, rank, inboxes, counter):
+    gathering = [item for item in self.gathered if item not in self.reduced]
+    trace = self.macro.trace
+    #with the hybrid backend, each chunk is split among threads of the
+    #process, each having its own copy of the tasks
+    def emit(message):
+      _, offset, count, collect = message
+      if len(self.part_codecs) == 1:
+        transport.send(pipe, message, self.part_codecs[0][0])
+        return
+      for codec, items in self.part_codecs:
+        part = dict((item, collect[item]) for item in items)
+        transport.send(pipe, ('part', offset, count, part), codec)
+    clones = None
+    if self.backend == 'hybrid':
+      clones = [self.__workerCopy() for i in range(self.thread_count)]
+      executor = futures.ThreadPoolExecutor(len(clones))
+      lock = threading.Lock()
+      emitPart = emit
+      def emit(message):
+        with lock:
+          emitPart(message)
+    while True:
+      with tracing.Span(trace, 'recv', 'transport'):
+        message = transport.recv(pipe)
+      if message is None:
+        break
+      offset, input_data = message
+      start = time.time()
+      if clones is not None:
+        sent = self.__runSplit(executor, clones, emit, offset, input_data, gathering, counter)
+      else:
+        sent = self.__runChunk(emit, offset, input_data, gathering, counter)
+      end = time.time()
+      #spans recorded on the way are sent along with the completion notice
+      events = []
+      if trace is not None:
+        count = len(input_data[0])
+        trace.add('chunk', 'parallel', start, end, items=count)
+        if not (self.batched or self.asynchronous) and clones is None:
+          #the tasks took turns on every item, so their spans are aggregated
+          at = start
+          for task, spent in zip(self.tasks, self.spent):
+            trace.add(task.name, 'parallel', at, at + spent, items=count)
+            at += spent
+          trace.add('send', 'transport', at, at + sent)
+          self.spent = [0.0] * len(self.plan)
+        events = trace.take()
+      #along with the failures of the items skipped in the chunk
+      failures = list(self.failures)
+      del self.failures[:]
+      transport.send(pipe, ('done', end - start, events, failures), self.codec)
+    #the threads' reductions are combined first
+    if clones is not None:
+      executor.shutdown()
+      for clone in clones:
+        clone.__closeRunner()
+        for task, reducer in zip(self.reducers, clone.reducers):
+          task.merge(reducer.partial())
+    self.__closeRunner()
+    #collect the outputs of any reduction tasks
+    collect = {}
+    #(remote workers have no inboxes, so they all send their reductions)
+    if not self.tree_reduce or inboxes is None or self.__reduceTree(rank, inboxes):
+      for task in self.reducers:
+        for item in task.getOutputs():
+          collect[item] = task.output()
+    #send the outputs over the pipe
+    transport.send(pipe, ('reduced', collect), self.codec)
+
+  def __runChunk(self, emit, offset, input_data, gathering, counter):
+    #processes a chunk of the input, passing the parts of the outputs to emit;
+    #returns the time spent on that (only measured for items run one by one)
+    if self.asynchronous:
+      return self.__runAsync(emit, offset, input_data, gathering, counter)
+    if self.batched:
+      self.__runBatches(emit, offset, input_data, gathering, counter)
+      return 0.0
+    return self.__runItems(emit, offset, input_data, gathering, counter)
+
+  def __runAsync(self, emit, offset, input_data, gathering, counter):
+    #processes the chunk with many items in flight at once (see asyncRunner);
+    #the items are done in any order, but the outputs are streamed back in
+    #order, in parts of stream_size consecutive items that are all done
+    if self.runner is None:
+      self.runner = asyncRunner.Runner(self.plan, self.awaited, self.slot_count,
+                                       self.gathered_slots, self.in_flight)
+    total = len(input_data[0])
+    outputs = [None] * total
+    counters, slot = counter
+    state = {'ready': 0, 'streamed': 0, 'sent': 0.0}
+    def stream(end):
+      begin = state['streamed']
+      columns = list(zip(*outputs[begin:end])) or [[]] * len(gathering)
+      collect = dict((item, list(column)) for item, column in zip(gathering, columns))
+      start = time.time()
+      emit(('part', offset + begin, end - begin, collect))
+      state['sent'] += time.time() - start
+      outputs[begin:end] = [()] * (end - begin)  #done with, but not None
+      state['streamed'] = end
+    def finished(index, values):
+      outputs[index] = values
+      counters[slot] += 1
+      ready = state['ready']
+      while ready < total and outputs[ready] is not None:
+        ready += 1
+      state['ready'] = ready
+      if ready - state['streamed'] >= self.stream_size:
+        stream(ready)
+    def failed(index):
+      self.__failure(offset + index)
+      return [None] * len(gathering)
+    self.runner.run(input_data, finished, failed)
+    if state['streamed'] < total:
+      stream(total)
+    return state['sent']
+
+  def __closeRunner(self):
+    if self.runner is not None:
+      self.runner.close()
+      self.runner = None
+
+  def __runSplit(self, executor, clones, emit, offset, input_data, gathering, counter):
+    #processes a chunk on threads, each running a contiguous slice of it
+    total = len(input_data[0])
+    size = total // len(clones) + 1
+    running = []
+    for clone, n_beg in zip(clones, range(0, total, size)):
+      data = [column[n_beg:n_beg+size] for column in input_data]
+      running.append(executor.submit(clone.__runChunk, emit, offset + n_beg, data, gathering, ([0], 0)))
+    sent = sum(future.result() for future in running)
+    #the threads count into counters of their own, added up once they are done
+    counter[0][counter[1]] += total
+    return sent
+
+  def __runItems(self, emit, offset, input_data, gathering, counter):
+    #processes the chunk item by item, streaming the outputs back in parts;
+    #returns the time spent on sending them
+    sent = 0.0
     #prepare to gather the outputs
-    collect = {item: [] for item in self.gathered}
+    collect = {item: [] for item in gathering}
+    columns = [collect[item] for item in gathering]
+    slots = [None] * self.slot_count
+    count = 0
+    counters, slot = counter
+    done = counters[slot]
     #iterate over lists that make up the input data
     for data in zip(*input_data):
-      #construct a local scope
-      scope = dict(zip(self.map_requests, data))
-      #iterate over the sequence of tasks
-      for task in self.tasks:
-        inputs = [scope[req] for req in task.getInputs()]
-        results = task.action(*inputs)
-        #pack outputs back but into the micro scope
-        outputs = task.getOutputs()
-        for result, key in zip(results if len(outputs) > 1 else (results,), outputs):
-          scope[key] = result
+      #reuse the item's outputs if they are in the cache
+      key, found = None, False
+      if self.item_cache is not None:
+        key = self.item_cache.key(self.item_signature, data)
+        if key is not None:
+          found, values = self.item_cache.get(key)
+      if not found:
+        try:
+          values = self.__runItem(slots, data)
+        except Exception:
+          self.__failure(offset + count)
+          values = [None] * len(columns)
+        else:
+          if key is not None:
+            self.item_cache.put(key, values)
       #if anything from the local scope was marked as gathered - do so
-      for item in self.gathered:
-        collect[item].append( scope[item] )
-      #report progress, if so requested (disabled by default)
-      if progress is not None: progress(len(input_data[0]))
-    #collect the outputs of any reduction tasks
-    for task in self.reducers:
-      for item in task.getOutputs():
-        collect[item] = task.output()
-    #send the outputs over the pipe
-    pipe.send(collect)
+      for column, value in zip(columns, values):
+        column.append(value)
+      #report progress
+      done += 1
+      counters[slot] = done
+      #stream the outputs back in parts of bounded size
+      count += 1
+      if count == self.stream_size:
+        start = time.time()
+        emit(('part', offset, count, collect))
+        sent += time.time() - start
+        collect = {item: [] for item in gathering}
+        columns = [collect[item] for item in gathering]
+        offset += count
+        count = 0
+    if count > 0:
+      start = time.time()
+      emit(('part', offset, count, collect))
+      sent += time.time() - start
+    return sent
+
+  def __runBatches(self, emit, offset, input_data, gathering, counter):
+    #column-wise variant of the item loop in sequence: each task processes
+    #a whole batch of items (at most stream_size) before the next task runs
+    trace = self.macro.trace
+    total = len(input_data[0])
+    for n_beg in range(0, total, self.stream_size):
+      n_end = min(total, n_beg + self.stream_size)
+      count = n_end - n_beg
+      #construct a local scope of columns
+      scope = dict((name, column[n_beg:n_end]) for name, column in zip(self.map_requests, input_data))
+      try:
+        for task in self.tasks:
+          with tracing.Span(trace, task.name, 'parallel', items=count):
+            self.__runBatch(task, scope, count)
+        collect = dict((item, list(scope[item])) for item in gathering)
+      except Exception:
+        self.__failure(offset + n_beg, count, task)
+        collect = dict((item, [None] * count) for item in gathering)
+      counter[0][counter[1]] += count
+      with tracing.Span(trace, 'send', 'transport'):
+        emit(('part', offset + n_beg, count, collect))
+
+  def __failure(self, index, count=1, task=None):
+    #called while handling an exception raised on the item of given index
+    #(or a batch of count items from it on); unless given, the failing task
+    #is told by the first frame of a task's method in the traceback - if it
+    #skips failing items, the failure is recorded, and otherwise raised
+    kind, error, tb = sys.exc_info()
+    text = ''.join(traceback.format_exception(kind, error, tb))
+    while task is None and tb is not None:
+      owner = tb.tb_frame.f_locals.get('self')
+      if any(owner is candidate for candidate in self.tasks):
+        task = owner
+      tb = tb.tb_next
+    if task is None or not getattr(task, 'skip_errors', False):
+      raise WorkerException(self.name if task is None else task.name, index, text, count)
+    self.failures.append((task.name, index, count, text))
+
+  def __runBatch(self, task, scope, count):
+    #runs the task on a batch of items in the given scope of columns,
+    #in a single call if it has action_batch, or else item by item
+    inputs = [scope[req] for req in task.getInputs()]
+    outputs = task.getOutputs()
+    if hasattr(task, 'action_batch'):
+      if task.batchArrays and numpy is not None:
+        inputs = [numpy.asarray(column) for column in inputs]
+      results = task.action_batch(*inputs)
+      columns = results if len(outputs) > 1 else (results,)
+      for column in columns:
+        if len(column) != count:
+          raise UserException(task.name,
+            'action_batch returned {} items for a batch of {}'.format(len(column), count))
+    else:
+      results = [task.action(*data) for data in zip(*inputs)]
+      columns = list(zip(*results)) if len(outputs) > 1 else (results,)
+    for column, name in zip(columns, outputs):
+      scope[name] = column
+
+  def __reduceTree(self, rank, inboxes):
+    #combines the reductions of all the processes in log2(n) rounds: in each
+    #round, every other remaining process sends its accumulators to its left
+    #neighbour (of the lower rank, holding the earlier items) and is done
+    #returns whether this process ended up with the complete reduction
+    step = 1
+    while step < len(inboxes):
+      if rank % (2 * step) != 0:
+        inboxes[rank - step].send(rank, [task.partial() for task in self.reducers])
+        return False
+      if rank + step < len(inboxes):
+        partials = inboxes[rank].recv(rank + step)
+        for task, partial in zip(self.reducers, partials):
+          task.merge(partial)
+      step *= 2
+    return True
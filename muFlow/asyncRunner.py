@@ -0,0 +1,74 @@
+#Running of MicroFlows whose tasks have coroutine actions (async def). This
+#module needs Python 3.5+ and is only imported there (see assembler).
+#Every worker (process or thread) has its own event loop, on which a chunk
+#of items is processed with up to a given number of items in flight: while
+#one item waits (e.g. for a database), the others proceed. The items are
+#finished in any order, so the outputs are reported along with the index of
+#the item.
+import asyncio
+import inspect
+
+def isAsync(task):
+  return inspect.iscoroutinefunction(task.action)
+
+class Runner(object):
+  def __init__(self, plan, awaited, slot_count, gathered_slots, in_flight):
+    self.plan = [step + (wait,) for step, wait in zip(plan, awaited)]
+    self.slot_count = slot_count
+    self.gathered_slots = gathered_slots
+    self.in_flight = in_flight
+    #created here rather than per chunk, so that whatever the tasks bind to
+    #the loop (connections, sessions) lives as long as the worker
+    self.loop = asyncio.new_event_loop()
+
+  async def runItem(self, slots, data):
+    #the async counterpart of MicroFlow.__runItem: coroutine actions are
+    #awaited, the others are just called
+    slots[:len(data)] = data
+    for action, inputs, outputs, wait in self.plan:
+      if inputs.__class__ is int:
+        result = action(slots[inputs])
+      else:
+        result = action(*[slots[i] for i in inputs])
+      if wait:
+        result = await result
+      if outputs.__class__ is int:
+        slots[outputs] = result
+      elif outputs is not None:
+        for i, value in zip(outputs, result):
+          slots[i] = value
+    return [slots[i] for i in self.gathered_slots]
+
+  async def drain(self, items, finished, failed):
+    #one of the in_flight lanes: takes the next item as soon as it is done
+    #with the previous one (the iterator is shared by all the lanes)
+    slots = [None] * self.slot_count
+    for index, data in items:
+      try:
+        values = await self.runItem(slots, data)
+      except Exception:
+        values = failed(index)
+      finished(index, values)
+
+  async def runChunk(self, input_data, finished, failed):
+    items = enumerate(zip(*input_data))
+    count = min(self.in_flight, len(input_data[0]))
+    lanes = [asyncio.ensure_future(self.drain(items, finished, failed)) for i in range(count)]
+    try:
+      await asyncio.gather(*lanes)
+    except BaseException:
+      #the items still in flight are not worth finishing
+      for lane in lanes:
+        lane.cancel()
+      await asyncio.gather(*lanes, return_exceptions=True)
+      raise
+
+  def run(self, input_data, finished, failed):
+    #processes the items of the chunk (a list of args, each being a list),
+    #calling finished(index, values) as each of them is done; failed(index)
+    #is called on an item that raised, while handling the exception, and
+    #either returns the values to use instead or raises
+    self.loop.run_until_complete(self.runChunk(input_data, finished, failed))
+
+  def close(self):
+    self.loop.close()
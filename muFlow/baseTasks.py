@@ -1,4 +1,5 @@
 import sys
+from copy import deepcopy
 
 if sys.version_info < (3,0):
   from metaClass2 import MetaClass
@@ -46,6 +47,15 @@ class BaseProcessor(MetaClass):
   outputs = []
   isValid = False
   isBase = True
+  #whether the results may be reused from the cache (see cache.ResultCache);
+  #tasks that have side effects or depend on anything besides their inputs
+  #and params (files, time, randomness) should set it to False
+  cacheable = True
+  #A serial task that can process its inputs item by item, as they come,
+  #may set streaming: in a pipelined run (see MacroFlow), if it directly
+  #follows a MicroFlow, it runs alongside it and receives the MicroFlow's
+  #outputs as iterators rather than lists.
+  streaming = False
 
   def __init__(self, args=[], dest=[], params=[], **kwargs):
     #print(self.name, args, dest, params)
@@ -173,7 +183,36 @@ class BaseProcessor(MetaClass):
 
 class BaseParallel(BaseProcessor):
   #Parallel tasks can only input lists. With multiple inputs, all lists must
-  #be the same length.
+  #be the same length. A serial task may also output an iterator (e.g. be a
+  #generator) instead of a list - the MicroFlow then consumes it lazily, one
+  #chunk at a time, while the workers are already processing the items.
+  #An iterator can be read only once, though: if more tasks read it, it is
+  #turned into a list as soon as it is output.
+  #On Python 3.5+, action may also be a coroutine (async def): each worker
+  #then keeps many items in flight, so that waiting for one of them (e.g. for
+  #a database to respond) does not hold up the others.
+  #Besides action, a task may define action_batch, which processes a whole
+  #batch of items in one call: it receives a list per input and returns
+  #a list per output (a tuple of them if there are more), each as long as the
+  #batch. With batchArrays set, the inputs are stacked into NumPy arrays
+  #first (if NumPy is available), and arrays may be returned as well. Such
+  #a task pays the interpreter overhead once per batch rather than per item.
+  batchArrays = False
+  #A task that mostly waits (e.g. on network or disk) can set backend to
+  #'thread', to be run on threads of the parent rather than in the worker
+  #processes, or 'process' to insist on the processes (see MicroFlow).
+  #None leaves the choice to the script.
+  backend = None
+  #How the outputs of the task are serialized when sent back from the worker
+  #processes, e.g. 'marshal+zlib' (see transport); None uses the codec of
+  #the script.
+  codec = None
+  #If the action raises on an item, the whole run fails (see
+  #errors.WorkerException). A task that sets skip_errors lets the run go on
+  #instead: the outputs of the failing item are all None, and the failure
+  #is recorded in the MicroFlow's skipped list. With action_batch, the whole
+  #batch is skipped.
+  skip_errors = False
   isBase = True
   def __init__(self, args=[], dest=[], params=[], **kwargs):
     super(BaseParallel, self).__init__(args, dest, params, **kwargs)
@@ -186,8 +225,12 @@ class BaseReducer(BaseProcessor):
   #serial task, performing the same reduction of the list of reduced sublists.
   #Reducer tasks input lists of multiple elements and return a list with only
   #a single element.
+  #A reducer whose reduction(a, b) modifies the accumulator b in place (and
+  #returns it) should set inplace - the accumulator then starts as a copy of
+  #the first item, so that no input is ever modified.
   inputs = ['item']
   outputs = ['item']
+  inplace = False
   isBase = True
 
   @classmethod
@@ -203,11 +246,24 @@ class BaseReducer(BaseProcessor):
     self.action = self.action_first
 
   def output(self):
+    #a process that received no items has nothing to contribute
+    if not hasattr(self, 'accumulator'):
+      return []
     return [self.final(self.accumulator)]
 
+  def partial(self):
+    #the accumulator (packed as a list, empty if there is none yet)
+    #to be merged into another instance of the task
+    return [self.accumulator] if hasattr(self, 'accumulator') else []
+
+  def merge(self, partial):
+    #reduces the accumulator of another instance, which covers later items
+    for item in partial:
+      self.action(item)
+
   def action_first(self, item):
     #initializes the accumulator and changes action into the proper function
-    self.accumulator = item
+    self.accumulator = deepcopy(item) if self.inplace else item
     self.action = self.action_every
 
   def action_every(self, item):
@@ -216,7 +272,7 @@ class BaseReducer(BaseProcessor):
 
   def action_final(self, item):
     #wrapper for executing from MacroFlow
-    self.accumulator = item[0]
+    self.accumulator = deepcopy(item[0]) if self.inplace else item[0]
     for i in item[1:]:
       self.action_every(i)
     return self.output()
@@ -0,0 +1,105 @@
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+
+def storePickle(path, value):
+  #pickles the value to a file that appears only once it is complete, so that
+  #other processes never read partially written data
+  folder = os.path.dirname(path)
+  fd, temp = tempfile.mkstemp(prefix='.', dir=folder)
+  try:
+    with os.fdopen(fd, 'wb') as stored:
+      pickle.dump(value, stored, protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(temp, path)
+  except:
+    os.remove(temp)
+    raise
+
+class ResultCache(object):
+  #On-disk store of task results, addressed by a digest of everything the
+  #result depends on: the task's name, the source code of its module, its
+  #parameters and the values of its inputs. Each result is a pickle file named
+  #after its key. Reading a result refreshes the file's modification time, so
+  #when the cache grows beyond max_size bytes, trim() evicts the least recently
+  #used results first. Files are written atomically, so worker processes can
+  #safely add results while others read them.
+  def __init__(self, path, max_size=1 << 30):
+    self.path = path
+    self.max_size = max_size
+    self.sources = {}  #digests of module sources, computed once per module
+    if not os.path.isdir(path):
+      os.makedirs(path)
+
+  def moduleDigest(self, cls):
+    module = cls.__module__
+    if module not in self.sources:
+      try:
+        with open(inspect.getsourcefile(cls), 'rb') as source:
+          self.sources[module] = hashlib.sha1(source.read()).hexdigest()
+      except (IOError, OSError, TypeError):
+        #the source is not available - the class name has to do
+        self.sources[module] = cls.__name__
+    return self.sources[module]
+
+  def signature(self, task):
+    #identifies what the task does: which code and with what parameters
+    params = [(param[0], repr(getattr(task, param[0]))) for param in task.params]
+    return (task.name, type(task).__name__, self.moduleDigest(type(task)), params)
+
+  def key(self, *parts):
+    #digest of the given objects, or None if any of them cannot be pickled
+    #(e.g. a generator) - a result depending on such a thing cannot be cached
+    try:
+      data = pickle.dumps(parts, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+      return None
+    return hashlib.sha1(data).hexdigest()
+
+  def __file(self, key):
+    #results are spread over subfolders to keep them reasonably small
+    return os.path.join(self.path, key[:2], key)
+
+  def get(self, key):
+    #returns a (found, value) tuple
+    path = self.__file(key)
+    try:
+      with open(path, 'rb') as stored:
+        value = pickle.load(stored)
+      os.utime(path, None)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+      return False, None
+    return True, value
+
+  def put(self, key, value):
+    path = self.__file(key)
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+      try:
+        os.makedirs(folder)
+      except OSError:
+        pass  #another process may have just created it
+    try:
+      storePickle(path, value)
+    except (pickle.PicklingError, TypeError, AttributeError):
+      #some results cannot be stored, that is fine
+      pass
+
+  def trim(self):
+    #evicts the least recently used results until the cache fits in its size
+    stored = []
+    for folder, _, names in os.walk(self.path):
+      for name in names:
+        #skip the results that are just being written
+        if name.startswith('.'):
+          continue
+        path = os.path.join(folder, name)
+        stats = os.stat(path)
+        stored.append((stats.st_mtime, stats.st_size, path))
+    total = sum(size for _, size, _ in stored)
+    for _, size, path in sorted(stored):
+      if total <= self.max_size:
+        break
+      os.remove(path)
+      total -= size
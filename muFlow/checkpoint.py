@@ -0,0 +1,101 @@
+import os
+import pickle
+import re
+
+from cache import storePickle
+from errors import *
+
+#names of the files of stored outputs (and parts of them) - the folder may
+#hold anything else, which is left alone
+OUTPUTS_FILE = re.compile(r'^task(\d+)(\.part(\d+))?\.pkl$')
+
+def describe(task):
+  #what the task does and on which items; a MicroFlow is described by its chain
+  if hasattr(task, 'reducers'):
+    return [describe(t) for t in task.tasks] + [list(task.getInputs()), list(task.getOutputs())]
+  params = [repr(getattr(task, param[0])) for param in task.params]
+  return [task.name, list(task.getInputs()), list(task.getOutputs()), params]
+
+class Checkpoint(object):
+  #Persists the progress of a MacroFlow in a folder, so that a run that died
+  #can be resumed instead of restarted. Whenever a top-level task completes,
+  #its outputs are pickled to their own file and the task is recorded in the
+  #manifest as done. MicroFlows additionally store every part of the outputs
+  #as it arrives from the workers, so that the items already processed are not
+  #sent out again. The manifest remembers the description of the whole flow,
+  #and only the very same script can be resumed from a checkpoint.
+  def __init__(self, path):
+    self.path = path
+    if not os.path.isdir(path):
+      os.makedirs(path)
+
+  def __file(self, name):
+    return os.path.join(self.path, name)
+
+  def __outputFiles(self, index=None, parts=False):
+    #names of the stored files, of all tasks or of the task of given index,
+    #either all of them or only the parts
+    names = []
+    for name in os.listdir(self.path):
+      match = OUTPUTS_FILE.match(name)
+      if match is None or not os.path.isfile(self.__file(name)):
+        continue
+      if index is not None and int(match.group(1)) != index:
+        continue
+      if parts and match.group(2) is None:
+        continue
+      names.append(name)
+    return names
+
+  def start(self, tasks, resume=False):
+    #prepare the checkpoint for the given tasks; when resuming, the indices
+    #of the tasks that completed in the previous run are returned
+    self.fingerprint = [describe(task) for task in tasks]
+    self.done = []
+    if resume and os.path.isfile(self.__file('manifest.pkl')):
+      with open(self.__file('manifest.pkl'), 'rb') as manifest:
+        fingerprint, self.done = pickle.load(manifest)
+      if fingerprint != self.fingerprint:
+        raise CheckpointException(self.path, 'was made by a different script')
+    else:
+      #a fresh run must not pick up anything from an old one
+      for name in self.__outputFiles():
+        os.remove(self.__file(name))
+      if os.path.isfile(self.__file('manifest.pkl')):
+        os.remove(self.__file('manifest.pkl'))
+      #written right away, so that even the parts stored during the very first
+      #task can be resumed
+      storePickle(self.__file('manifest.pkl'), (self.fingerprint, self.done))
+    return list(self.done)
+
+  def restore(self, index):
+    #returns the dict of outputs stored for a completed task
+    with open(self.__file('task{}.pkl'.format(index)), 'rb') as stored:
+      return pickle.load(stored)
+
+  def save(self, index, outputs):
+    #stores the dict of outputs of a completed task and marks it as done;
+    #returns False if the outputs cannot be stored (e.g. they are iterators),
+    #in which case the task will simply run again after resuming
+    try:
+      storePickle(self.__file('task{}.pkl'.format(index)), outputs)
+    except (pickle.PicklingError, TypeError, AttributeError):
+      return False
+    self.done.append(index)
+    storePickle(self.__file('manifest.pkl'), (self.fingerprint, self.done))
+    #parts of the outputs are not needed anymore
+    for name in self.__outputFiles(index, parts=True):
+      os.remove(self.__file(name))
+    return True
+
+  def savePart(self, index, offset, count, output):
+    #stores a part of the outputs of a MicroFlow (dict of lists of count items)
+    storePickle(self.__file('task{}.part{}.pkl'.format(index, offset)), (offset, count, output))
+
+  def loadParts(self, index):
+    #returns all the stored parts of the outputs of a MicroFlow
+    parts = []
+    for name in self.__outputFiles(index, parts=True):
+      with open(self.__file(name), 'rb') as stored:
+        parts.append(pickle.load(stored))
+    return sorted(parts, key=lambda part: part[0])
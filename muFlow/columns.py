@@ -0,0 +1,115 @@
+#Storage of the gathered outputs of a MicroFlow. The parts of an output
+#arrive from the workers in any order, each with the offset of its first
+#item, and are put in place in a column. A ListColumn holds any objects;
+#a TypedColumn (used with the columnar option) holds the values in a single
+#contiguous buffer instead - an array of doubles or 64-bit integers if all
+#the values are Python floats or ints, or a NumPy array if they are NumPy
+#arrays (or scalars) of the same shape and dtype. That saves memory (no
+#object per value) and the serial tasks receive the buffer, which behaves
+#like a list for reading. Should a part not fit the buffer, the column turns
+#into a list after all.
+from array import array
+
+#####Optional dependencies#####
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+#####Python 2 and 3 compatibility#####
+try:
+  array('q')
+  INT_CODE = 'q'
+except ValueError:
+  INT_CODE = 'l'
+
+class ListColumn(object):
+  def __init__(self, total=None):
+    #total is None for inputs of unknown length; the column grows as needed
+    self.values = [None] * (total or 0)
+
+  def place(self, offset, count, values):
+    if len(self.values) < offset + count:
+      self.values.extend([None] * (offset + count - len(self.values)))
+    self.values[offset:offset+count] = values
+
+  def result(self):
+    return self.values
+
+def describe(values):
+  #the kind of buffer that can hold the values: a typecode of array, or the
+  #shape and dtype of NumPy values; None if they need a list
+  first = values[0]
+  kind = type(first)
+  if kind is float or kind is int:
+    if all(type(value) is kind for value in values):
+      return 'd' if kind is float else INT_CODE
+  elif numpy is not None and isinstance(first, (numpy.ndarray, numpy.generic)):
+    shape, dtype = first.shape, first.dtype
+    if dtype != object and all(
+      isinstance(value, (numpy.ndarray, numpy.generic)) and
+      value.shape == shape and value.dtype == dtype for value in values
+    ):
+      return (shape, dtype)
+  return None
+
+class TypedColumn(object):
+  def __init__(self, total=None):
+    self.total = total
+    self.length = 0      #number of items up to the end of the furthest part
+    self.kind = None     #see describe, decided by the first part
+    self.buffer = None
+    self.fallback = None  #ListColumn, once the values do not fit a buffer
+
+  def __allocate(self, size):
+    if isinstance(self.kind, tuple):
+      shape, dtype = self.kind
+      return numpy.empty((size,) + shape, dtype)
+    return array(self.kind, [0]) * size
+
+  def __grow(self, size):
+    #for inputs of unknown length the buffer doubles, and is trimmed at last
+    if len(self.buffer) >= size:
+      return
+    grown = self.__allocate(max(size, 2 * len(self.buffer)))
+    grown[:len(self.buffer)] = self.buffer
+    self.buffer = grown
+
+  def __toList(self):
+    self.fallback = ListColumn(self.total)
+    if self.buffer is not None:
+      self.fallback.place(0, self.length, list(self.buffer[:self.length]))
+      self.buffer = None
+
+  def place(self, offset, count, values):
+    if self.fallback is None and count > 0:
+      kind = describe(values)
+      if self.buffer is None and kind is not None:
+        self.kind = kind
+        self.buffer = self.__allocate(self.total or count)
+      if kind is None or kind != self.kind:
+        self.__toList()
+    if self.fallback is not None:
+      self.fallback.place(offset, count, values)
+      return
+    self.__grow(offset + count)
+    if isinstance(self.kind, tuple):
+      self.buffer[offset:offset+count] = values
+    else:
+      try:
+        self.buffer[offset:offset+count] = array(self.kind, values)
+      except OverflowError:
+        #integers beyond 64 bits
+        self.__toList()
+        self.fallback.place(offset, count, values)
+        return
+    self.length = max(self.length, offset + count)
+
+  def result(self):
+    if self.fallback is not None:
+      return self.fallback.result()
+    if self.buffer is None:
+      return [None] * (self.total or 0)
+    if len(self.buffer) > self.length:
+      self.buffer = self.buffer[:self.length]
+    return self.buffer
@@ -25,6 +25,33 @@ class ConstructException(muException):
     self.message = text + ' (' + taskname + ')'
     super(ConstructException, self).__init__(self.message)
 
+class CheckpointException(muException):
+  def __init__(self, path, text):
+    self.message = 'checkpoint in "{}" {}'.format(path, text)
+    super(CheckpointException, self).__init__(self.message)
+
+class RemoteException(muException):
+  def __init__(self, address, text):
+    self.message = 'remote worker {}: {}'.format(address, text)
+    super(RemoteException, self).__init__(self.message)
+
+class WorkerException(muException):
+  #a task failed on an item (or a batch of count items, from index on) in
+  #a worker; text is the traceback, as formatted there
+  def __init__(self, taskname, index, text, count=1):
+    self.taskname = taskname
+    self.index = index
+    self.count = count
+    self.text = text
+    if index is None:
+      where = 'failed'
+    elif count > 1:
+      where = 'failed on items {} to {}'.format(index, index + count - 1)
+    else:
+      where = 'failed on item {}'.format(index)
+    self.message = '[{}]: {}\n{}'.format(taskname, where, text.rstrip())
+    super(WorkerException, self).__init__(self.message)
+
 class ParsingException(muException):
   def __init__(self, token, state, line=''):
     self.message = 'Unexpected {} when scanning for {}.'.format(token.debug, state.value)
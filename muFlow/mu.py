@@ -1,4 +1,5 @@
 import argparse
+import os
 import sys
 
 from assembler import Assembler
@@ -6,9 +7,78 @@ from baseTasks import muException
 
 if __name__ == "__main__":
   p = argparse.ArgumentParser(description='muFlow, the parallel processing engine')
-  p.add_argument('script', nargs='?', default=None, help='Script to run')
+  p.add_argument('script', nargs='?', default=None,
+      help='Script to run, or "worker" to serve as a remote worker (see --listen)')
+  p.add_argument('address', nargs='?', default=None,
+      help='With "worker": HOST:PORT of the coordinator to connect to')
   p.add_argument('--num-processes', '-n', type=int, default=0,
       help='Number of processes to spawn (default is CPU count)')
+  p.add_argument('--schedule', choices=['static', 'dynamic'], default='static',
+      help='Work distribution: one slice per process (static, default), or small chunks ' +
+      'handed out to processes as they become free (dynamic)')
+  p.add_argument('--stream-size', type=int, default=256,
+      help='Maximum number of items a process sends back at once (default is 256)')
+  p.add_argument('--tree-reduce', action='store_true',
+      help='Processes combine their reductions in pairs instead of the parent combining all of them')
+  p.add_argument('--backend', choices=['process', 'thread', 'hybrid'], default='process',
+      help='What parallel tasks run on: worker processes (default), threads of a single ' +
+      'process - for tasks that mostly wait on I/O, or threads within each process (hybrid); ' +
+      'tasks may ask for a backend themselves')
+  p.add_argument('--threads', type=int, default=0,
+      help='Number of threads (per process with the hybrid backend; default is CPU count + 4, ' +
+      'or 4 per process)')
+  p.add_argument('--in-flight', type=int, default=64,
+      help='Number of items each process (or thread) works on at once, if a parallel task ' +
+      'has a coroutine (async def) action (default is 64)')
+  p.add_argument('--columnar', action='store_true',
+      help='Gather numeric outputs of parallel tasks (numbers, NumPy arrays of one shape) into ' +
+      'arrays instead of lists - serial tasks then receive array-likes')
+  p.add_argument('--codec', type=str, default=None,
+      help='How data is serialized for the processes: pickle (default) or marshal (faster for ' +
+      'plain numbers, strings, lists and dicts), optionally compressed: pickle+zlib, marshal+lz4')
+  p.add_argument('--optimize', action='store_true',
+      help='Reorder the tasks so that parallel ones are fused into fewer MicroFlows, and drop ' +
+      'tasks whose outputs are never used (see also --keep)')
+  p.add_argument('--plan', action='store_true',
+      help='Print the order in which the tasks would be executed, instead of running them')
+  p.add_argument('--pipeline', action='store_true',
+      help='Run streaming serial tasks along with the parallel tasks right before them, ' +
+      'passing the results as they come')
+  p.add_argument('--pipeline-depth', type=int, default=16,
+      help='With --pipeline: parts of results that may wait for a streaming task, before the ' +
+      'parallel tasks are held back (default is 16)')
+  p.add_argument('--concurrent', action='store_true',
+      help='Run independent tasks at the same time, sharing the processes among parallel ones')
+  p.add_argument('--free-dead', action='store_true',
+      help='Release intermediate results as soon as no further task needs them')
+  p.add_argument('--keep', action='append', default=[], metavar='ITEM',
+      help='With --free-dead: never release the given item, as it is a final output ' +
+      '(can be given multiple times)')
+  p.add_argument('--cache', type=str, default=None, metavar='DIR',
+      help='Reuse results of tasks (and items of parallel tasks) stored in this folder ' +
+      'by previous runs, and store new ones there')
+  p.add_argument('--cache-size', type=int, default=1024, metavar='MB',
+      help='Size limit of the cache, least recently used results are evicted (default is 1024)')
+  p.add_argument('--checkpoint', type=str, default=None, metavar='DIR',
+      help='Store the outputs of every completed task (and parallel item) in this folder')
+  p.add_argument('--resume', action='store_true',
+      help='With --checkpoint: skip the work completed by a previous run of the same script')
+  p.add_argument('--spill', type=str, default=None, metavar='DIR',
+      help='Move large items to files in this folder when they would not fit in memory ' +
+      '(see --memory-budget); tasks then read them from there as needed')
+  p.add_argument('--memory-budget', type=int, default=None, metavar='MB',
+      help='With --spill: memory the items may take (default is half of the physical memory)')
+  p.add_argument('--trace', type=str, default=None, metavar='FILE',
+      help='Save the time spent on every task and transfer, in all the processes, ' +
+      'to a JSON file viewable in chrome://tracing or Perfetto')
+  p.add_argument('--listen', type=str, default=None, metavar='HOST:PORT',
+      help='Run parallel tasks on remote workers, which connect to this address ' +
+      '(started with "mu.py worker HOST:PORT" with the same tasks folder)')
+  p.add_argument('--workers', type=int, default=1,
+      help='With --listen: number of remote workers to wait for (default is 1)')
+  p.add_argument('--authkey', type=str, default=os.environ.get('MUFLOW_AUTHKEY'),
+      help='Key authenticating the coordinator and the remote workers to each other ' +
+      '(default is the MUFLOW_AUTHKEY environment variable)')
   p.add_argument('--debug', action='store_true',
       help='Debug mode: each parallel task processes only the first item in a single process')
   p.add_argument('--info', type=str, nargs='?', const='', default=None,
@@ -26,18 +96,62 @@ if __name__ == "__main__":
   if args.info is not None:
     asm.printInfo(args.info if args.info != '' else None)
     exit()
+  if args.resume and args.checkpoint is None:
+    p.error('--resume requires --checkpoint')
+  if args.memory_budget is not None and args.spill is None:
+    p.error('--memory-budget requires --spill')
   if args.script is None:
     print("You are supposed to pass a path to the script file as the first positional argument.")
     exit()
+  if (args.listen is not None or args.script == 'worker') and args.authkey is None:
+    p.error('remote workers require --authkey (or MUFLOW_AUTHKEY)')
+  if args.script == 'worker':
+    if args.address is None:
+      p.error('worker requires the HOST:PORT of the coordinator')
+    try:
+      asm.runWorker(args.address, args.authkey)
+    except muException as e:
+      e.die()
+    exit()
 
   with open(args.script, 'r') as script_file:
     script = [line.strip('\n') for line in script_file.readlines()]
   try:
     flow = asm.assembleFromText(lines=script,
                                 num_proc=args.num_processes,
-                                debug=args.debug
+                                debug=args.debug,
+                                schedule=args.schedule,
+                                stream_size=args.stream_size,
+                                concurrent=args.concurrent,
+                                free_dead=args.free_dead,
+                                keep=args.keep,
+                                cache_dir=args.cache,
+                                cache_size=args.cache_size << 20,
+                                checkpoint_dir=args.checkpoint,
+                                resume=args.resume,
+                                tree_reduce=args.tree_reduce,
+                                trace_file=args.trace,
+                                backend=args.backend,
+                                threads=args.threads,
+                                in_flight=args.in_flight,
+                                columnar=args.columnar,
+                                codec=args.codec,
+                                spill_dir=args.spill,
+                                memory_budget=None if args.memory_budget is None else args.memory_budget << 20,
+                                remote=args.listen,
+                                remote_workers=args.workers,
+                                authkey=args.authkey,
+                                pipeline=args.pipeline,
+                                pipeline_depth=args.pipeline_depth,
+                                optimize=args.optimize
     )
   except muException as e:
     e.die()
+  if args.plan:
+    flow.printPlan()
+    exit()
   
-  flow.execute()
+  try:
+    flow.execute()
+  except muException as e:
+    e.die()
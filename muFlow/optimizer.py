@@ -0,0 +1,108 @@
+#Optimization of the order of tasks of a script, before they are assembled
+#into a MacroFlow. The script is given as a list of (kind, task) tuples, kind
+#being 'serial', 'parallel' or 'reducer', and a new list is returned.
+#Every serial task placed between two parallel ones splits them into separate
+#MicroFlows, so all the data has to be gathered from the processes and sent
+#out again. The optimizer moves such serial tasks out of the way where they do
+#not depend on the parallel ones, and drops the tasks whose results nobody
+#needs. Only the order in which the tasks read and write the items is
+#preserved - which is all that a task can observe, unless it has side
+#effects; such tasks must not be cacheable (see BaseProcessor), and are never
+#moved past one another, nor dropped.
+
+def conflict(a, b):
+  #whether the order of the two tasks matters: one reads or writes what the
+  #other writes, or both may have side effects
+  if not (a.cacheable or b.cacheable):
+    return True
+  a_in, a_out = set(a.getInputs()), set(a.getOutputs())
+  b_in, b_out = set(b.getInputs()), set(b.getOutputs())
+  return len(a_out & (b_in | b_out)) > 0 or len(a_in & b_out) > 0
+
+def eliminateDead(tasks, keep=()):
+  #drops the tasks whose outputs are never read afterwards - if the final
+  #outputs are given (keep), everything else is considered intermediate,
+  #otherwise any item that is not overwritten later is a result
+  #returns the list of remaining tasks and the list of the dropped ones
+  if len(keep) > 0:
+    live = set(keep)
+  else:
+    live = set(item for _, task in tasks for item in task.getOutputs())
+  remaining, dropped = [], []
+  for kind, task in reversed(tasks):
+    outputs = set(task.getOutputs())
+    if task.cacheable and len(outputs) > 0 and len(outputs & live) == 0:
+      dropped.append((kind, task))
+      continue
+    live -= outputs
+    live |= set(task.getInputs())
+    remaining.append((kind, task))
+  return remaining[::-1], dropped[::-1]
+
+def related(first, second):
+  #whether the second group of parallel tasks iterates over the same items
+  #as the first: it only reads what the first reads or produces per item
+  #(the results of reducers are only available after the MicroFlow)
+  known = set()
+  for kind, task in first:
+    known |= set(task.getInputs())
+    if kind != 'reducer':
+      known |= set(task.getOutputs())
+  for kind, task in second:
+    if not set(task.getInputs()) <= known:
+      return False
+    if kind != 'reducer':
+      known |= set(task.getOutputs())
+  return True
+
+def separate(first, between, second):
+  #tries to move the serial tasks from between the two groups of parallel
+  #tasks, either before the first or after the second; returns the lists of
+  #tasks to go before and after, or None if that is not possible
+  before, after = [], []
+  for kind, task in between:
+    if any(conflict(task, other) for _, other in first + after):
+      after.append((kind, task))
+    else:
+      before.append((kind, task))
+  if any(conflict(task, other) for _, task in after for _, other in second):
+    return None
+  return before, after
+
+def fuse(tasks):
+  #fuses groups of parallel tasks split by serial tasks, which do not depend
+  #on them, into a single group (MicroFlow) - by moving the serial tasks out
+  #of the way; only groups iterating over the same items are fused
+  #the script is first cut into segments: groups of consecutive parallel
+  #tasks, and single serial tasks
+  segments = []
+  for kind, task in tasks:
+    if kind == 'serial':
+      segments.append([(kind, task)])
+    elif len(segments) > 0 and segments[-1][0][0] != 'serial':
+      segments[-1].append((kind, task))
+    else:
+      segments.append([(kind, task)])
+  isGroup = lambda segment: segment[0][0] != 'serial'
+  fused = True
+  while fused:
+    fused = False
+    groups = [i for i, segment in enumerate(segments) if isGroup(segment)]
+    for i, j in zip(groups, groups[1:]):
+      if not related(segments[i], segments[j]):
+        continue
+      moved = separate(segments[i], [s[0] for s in segments[i+1:j]], segments[j])
+      if moved is None:
+        continue
+      before, after = moved
+      segments[i:j+1] = (
+        [[task] for task in before] + [segments[i] + segments[j]] + [[task] for task in after]
+      )
+      fused = True
+      break
+  return [task for segment in segments for task in segment]
+
+def optimize(tasks, keep=()):
+  #returns the optimized list of tasks and the list of the dropped ones
+  remaining, dropped = eliminateDead(tasks, keep)
+  return fuse(remaining), dropped
@@ -0,0 +1,84 @@
+#Streaming of the outputs of a MicroFlow into the serial task right after it,
+#while the MicroFlow is still running (see MacroFlow, pipeline option). The
+#parts of the outputs go through a queue of bounded depth: once it is full,
+#the MicroFlow stops taking in the workers' results - and so the workers stop
+#too, once their pipes are full - until the task catches up. The parts arrive
+#from the workers in any order, but the task receives the items in order.
+import collections
+
+#####Python 2 and 3 compatibility#####
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+class StreamAbandoned(Exception):
+  #raised in the MicroFlow if the task reading the stream failed
+  pass
+
+class Stream(object):
+  def __init__(self, items, depth=16):
+    self.items = items  #names of the streamed outputs
+    self.queue = queue.Queue(depth)  #of parts - lists of values per item
+    self.pending = {}  #parts that came ahead of their turn, by offset
+    self.position = 0  #offset of the next part to be passed on
+    self.buffers = dict((item, collections.deque()) for item in items)
+    self.closed = False
+    self.abandoned = False
+
+  def __enqueue(self, part):
+    #blocks while the queue is full, unless the reader is gone
+    while not self.abandoned:
+      try:
+        self.queue.put(part, timeout=0.1)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  def put(self, offset, count, output):
+    #called by the MicroFlow with every part of its outputs; a part may come
+    #in several messages, each with some of the items (see MicroFlow codecs)
+    entry = self.pending.setdefault(offset, (count, {}))
+    entry[1].update((item, output[item]) for item in self.items if item in output)
+    while self.position in self.pending and len(self.pending[self.position][1]) == len(self.items):
+      count, values = self.pending.pop(self.position)
+      if not self.__enqueue([values[item] for item in self.items]):
+        raise StreamAbandoned()
+      self.position += count
+
+  def close(self):
+    #called once the MicroFlow is done, whether it succeeded or not
+    self.__enqueue(None)
+
+  def abandon(self):
+    #called if the reader fails, so that the MicroFlow does not wait for it
+    self.abandoned = True
+
+  def __fetch(self):
+    #moves the next part from the queue into the buffers of the items;
+    #returns False once the stream is closed
+    part = self.queue.get()
+    if part is None:
+      self.closed = True
+      return False
+    for item, values in zip(self.items, part):
+      self.buffers[item].extend(values)
+    return True
+
+  def iterate(self, item):
+    #the values of the item, in order - iterators of several items should
+    #be read in step (e.g. zipped), or the buffers of the others grow
+    buffer = self.buffers[item]
+    while True:
+      if len(buffer) > 0:
+        yield buffer.popleft()
+      elif self.closed or not self.__fetch():
+        return
+
+  def drain(self):
+    #reads the rest of the stream, if the task did not need all of it
+    while not self.closed:
+      self.__fetch()
+    for buffer in self.buffers.values():
+      buffer.clear()
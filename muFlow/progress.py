@@ -5,42 +5,56 @@ VT100_FLAG = True
 VT100_DELETE_LINE = '\x1b[1A' + '\x1b[2K' + '\x1b[1A'
 
 class ParallelReporter(object):
-  #a callable object that keeps track of the number of times it has been called
-  #and, given the total number of times it is going to be called, prints some
-  #progress reports every second
+  #a callable object that follows the progress of the worker processes through
+  #shared counters of the items done by each of them (see WorkerPool), which
+  #the workers update without any messaging; when called, it prints a report
+  #if a full second elapsed since the last one: the percentage done, items per
+  #second, the estimated time remaining, and how many items the slowest worker
+  #lags behind the fastest one
   def __init__(self, text):
-    self.message = text
-    self.isSet   = False
-    self.total   = -1
-    self.count   = 0
+    self.message  = text
+    self.counters = None
   
-  def setup(self, n):
-    self.total = n
-    self.count = 0
+  def setup(self, total, counters, slots):
+    #start following the given slots of the counters, with the given total
+    #number of items to be processed (None if not known in advance)
+    self.total    = total
+    self.counters = counters
+    self.slots    = slots
+    for slot in slots:
+      counters[slot] = 0
     self.start = time.time()
     self.last  = self.start
-    self.isSet = True
   
-  def __call__(self, total_count):
+  def report(self):
+    #returns the text of the report, given the current state of the counters
+    done = [self.counters[slot] for slot in self.slots]
+    count = sum(done)
+    rate = count / (time.time() - self.start)
+    #(if the total is not known, only the number of items can be shown)
+    if self.total is None:
+      text = ', {} items done'.format(count)
+    else:
+      text = ', {:3.0f}% done'.format(100.0 * count / max(self.total, 1))
+    text += ', {:.0f} items/s'.format(rate)
+    if self.total is not None and rate > 0:
+      text += ', ETA {:.0f}s'.format((self.total - count) / rate)
+    if len(done) > 1:
+      text += ', lag {} items'.format(max(done) - min(done))
+    return self.message + text + ' '
+  
+  def __call__(self):
     global PRINT_FLAG
     global VT100_FLAG
     global VT100_DELETE_LINE
-    #the assumptions are that total_count does not change between calls,
-    #and the first call initializes the object
-    #the latter is due to not knowing the total_count at construction
-    if not self.isSet:
-      self.setup(total_count)
-    #keep track of the number of processed items
-    self.count += 1
     #check whether a full second elapsed since the last call
-    if time.time() - self.last > 1.0:
-      #calculate % of work done and print
-      percent = 1.0 * self.count / self.total
-      if PRINT_FLAG:
-        if VT100_FLAG: print(VT100_DELETE_LINE)
-        print(self.message + ', {:3.0f}% done '.format(100*percent))
-      #log the last call time
-      self.last = time.time()
+    if self.counters is None or time.time() - self.last < 1.0:
+      return
+    if PRINT_FLAG:
+      if VT100_FLAG: print(VT100_DELETE_LINE)
+      print(self.report())
+    #log the last call time
+    self.last = time.time()
 
 class SerialReporter(object):
   #keeps track of time, allowing measuring time taken by a sequence of tasks
@@ -60,10 +74,14 @@ class SerialReporter(object):
     if PRINT_FLAG:
       print(self.task_text)
   
-  def __print_event(self, text, secs):
-    print(text + '  ({:.1f}s)'.format(secs))
+  def __print_event(self, text, secs, detail=None):
+    if detail is None:
+      print(text + '  ({:.1f}s)'.format(secs))
+    else:
+      print(text + '  ({:.1f}s, {})'.format(secs, detail))
   
-  def stop(self):
+  def stop(self, detail=None):
+    #detail is an optional note to the time, like the amount of data moved
     global PRINT_FLAG
     global VT100_FLAG
     global VT100_DELETE_LINE
@@ -72,7 +90,7 @@ class SerialReporter(object):
       if PRINT_FLAG:
         if VT100_FLAG:
           print(VT100_DELETE_LINE)
-        self.__print_event(self.task_text, taken)
+        self.__print_event(self.task_text, taken, detail)
       #self.task_time = None
       return taken
 
@@ -83,6 +101,13 @@ class SerialReporter(object):
       self.__print_event(message, taken)
     return taken
 
+def formatBytes(count):
+  for unit in ('B', 'kB', 'MB', 'GB'):
+    if count < 1024 or unit == 'GB':
+      break
+    count /= 1024.0
+  return ('{:.0f} {}' if unit == 'B' else '{:.1f} {}').format(count, unit)
+
 def useVT100(flag):
   global VT100_FLAG
   VT100_FLAG = True if flag else False
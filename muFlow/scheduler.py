@@ -0,0 +1,114 @@
+from itertools import islice
+
+#####Python 2 and 3 compatibility#####
+try:
+  from multiprocessing.connection import wait as waitPipes
+except ImportError:
+  import select
+  def waitPipes(pipes, timeout=None):
+    return select.select(pipes, [], [], timeout)[0]
+try:
+  from itertools import izip
+except ImportError:
+  izip = zip
+
+class ChunkSizer(object):
+  #Decides how many items to send to a worker at once when the MicroFlow is
+  #scheduled dynamically. It starts with single items to measure the cost of
+  #processing quickly, then sizes the chunks so that each of them takes about
+  #'target' seconds - long enough for the messaging overhead to not matter.
+  #Chunks never exceed a fraction of the remaining work per worker (guided
+  #self-scheduling), so the end of the stage is not held by a single large
+  #chunk while the other workers sit idle.
+  #Workers that keep many items in flight at once (coroutine actions) need
+  #chunks of at least that many items to be kept busy - the minimum.
+  def __init__(self, num_workers, target=0.05, initial=1, minimum=1):
+    self.workers  = num_workers
+    self.target   = target
+    self.minimum  = minimum
+    self.size     = max(initial, minimum)
+    self.per_item = None
+
+  def update(self, count, elapsed):
+    #feed back the measured time of a completed chunk
+    if count <= 0:
+      return
+    sample = 1.0 * elapsed / count
+    if self.per_item is None:
+      self.per_item = sample
+    else:
+      #smooth the estimate to not overreact to a single odd chunk
+      self.per_item = 0.7 * self.per_item + 0.3 * sample
+    if self.per_item > 0:
+      self.size = max(self.minimum, int(self.target / self.per_item))
+    else:
+      self.size *= 2
+
+  def next(self, remaining):
+    #size of the next chunk, given the number of items yet to be sent
+    #(which is None if it is not known in advance)
+    if remaining is None:
+      return self.size
+    return max(self.minimum, min(self.size, remaining // (2 * self.workers)))
+
+class ChunkSource(object):
+  #Cuts the inputs of a MicroFlow into consecutive chunks. Lists are sliced,
+  #but if any of the inputs is an iterator (e.g. returned by a generator), all
+  #of them are consumed lazily - only as far as the chunks taken so far - so
+  #the whole input never has to exist at once. Its length is then unknown.
+  #Ranges of items that are already done (a list of (offset, count) tuples)
+  #can be given to skip; chunks never span over them.
+  def __init__(self, args, limit=None, skip=()):
+    self.position = 0
+    self.skip = sorted(skip)
+    if all(hasattr(arg, '__len__') and hasattr(arg, '__getitem__') for arg in args):
+      self.args = args
+      self.rows = None
+      self.total = len(args[0])
+      if limit is not None:
+        self.total = min(self.total, limit)
+    else:
+      self.args = None
+      self.rows = izip(*[iter(arg) for arg in args])
+      self.total = None
+      if limit is not None:
+        self.rows = islice(self.rows, limit)
+
+  def remaining(self):
+    if self.total is None:
+      return None
+    return self.total - self.position - sum(count for _, count in self.skip)
+
+  def __skipDone(self):
+    #moves past the done ranges starting at the current position, and returns
+    #the position of the next one (or None if there are no more)
+    while len(self.skip) > 0 and self.skip[0][0] <= self.position:
+      offset, count = self.skip.pop(0)
+      end = offset + count
+      if end > self.position:
+        if self.rows is not None:
+          for _ in islice(self.rows, end - self.position):
+            pass
+        self.position = end
+    return self.skip[0][0] if len(self.skip) > 0 else None
+
+  def take(self, size):
+    #returns the offset and the list of args of the next chunk,
+    #or None if the inputs are exhausted
+    next_done = self.__skipDone()
+    if next_done is not None:
+      size = min(size, next_done - self.position)
+    n_beg = self.position
+    if self.rows is None:
+      if n_beg >= self.total:
+        return None
+      n_end = min(self.total, n_beg + size)
+      chunk = [arg[n_beg:n_end] for arg in self.args]
+    else:
+      rows = list(islice(self.rows, size))
+      if len(rows) == 0:
+        return None
+      n_end = n_beg + len(rows)
+      chunk = [list(column) for column in zip(*rows)]
+    self.position = n_end
+    return n_beg, chunk
@@ -0,0 +1,194 @@
+#Spilling of large scope items to disk, to run scripts whose data does not
+#fit in memory. A Spiller watches the estimated size of the scope against
+#a memory budget: once it is exceeded, the largest items are written to
+#files in a scratch folder and replaced with lazy, memory-mapped sequences -
+#NumPy arrays (and arrays of numbers, see columns) become read-only
+#numpy.memmap arrays, lists and tuples become SpilledLists. Both can be indexed, sliced, iterated over
+#and cut into chunks for the MicroFlows like the lists they replace, while
+#the OS pages them in and out as needed. Spilled items are read-only.
+#Outputs gathered by MicroFlows are watched as they grow (see SpillColumn),
+#so even a single output larger than the memory never has to be held whole.
+#The files are deleted as soon as they are mapped: the data stays available
+#for as long as the mapping lives, and is never left behind, not even by
+#a crashed run.
+import mmap
+import os
+import pickle
+import sys
+import tempfile
+from array import array
+
+import columns
+
+#####Optional dependencies#####
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+SPILL_MINIMUM = 1 << 20  #smaller items are not worth a file
+SAMPLE_SIZE = 64  #number of elements sampled to estimate the size of a list
+
+def defaultBudget():
+  #half of the physical memory, if that can be told
+  try:
+    return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 2
+  except (AttributeError, ValueError, OSError):
+    return 1 << 30
+
+def estimateSize(value):
+  #approximate number of bytes the value takes in memory; lists are not
+  #traversed, but a sample of their elements is measured
+  if isinstance(value, SpilledList):
+    return 0
+  if numpy is not None and isinstance(value, numpy.ndarray):
+    return 0 if isinstance(value, numpy.memmap) else value.nbytes
+  if isinstance(value, array):
+    return value.itemsize * len(value)
+  if isinstance(value, (list, tuple)):
+    size = sys.getsizeof(value)
+    if len(value) > 0:
+      step = max(1, len(value) // SAMPLE_SIZE)
+      sample = [estimateSize(value[i]) for i in range(0, len(value), step)]
+      size += len(value) * sum(sample) // len(sample)
+    return size
+  return sys.getsizeof(value)
+
+def scratchFile(directory):
+  #an open file that is already deleted
+  fd, path = tempfile.mkstemp(prefix='muflow-spill-', dir=directory)
+  os.unlink(path)
+  return os.fdopen(fd, 'w+b')
+
+class SpilledList(object):
+  #A sequence of pickled values in a file, each at a position recorded in
+  #memory (16 bytes per value). It is filled by place(), in parts that may
+  #come in any order, and can be read once sealed.
+  def __init__(self, directory, total=None):
+    self.file = scratchFile(directory)
+    self.starts = array(columns.INT_CODE, [0]) * (total or 0)
+    self.ends = array(columns.INT_CODE, [0]) * (total or 0)
+    self.size = 0  #of the file
+    self.mapping = None
+
+  def place(self, offset, count, values):
+    if len(self.starts) < offset + count:
+      grow = array(columns.INT_CODE, [0]) * (offset + count - len(self.starts))
+      self.starts.extend(grow)
+      self.ends.extend(grow)
+    data = [pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL) for value in values]
+    self.file.write(b''.join(data))
+    for i, pickled in enumerate(data):
+      self.starts[offset + i] = self.size
+      self.size += len(pickled)
+      self.ends[offset + i] = self.size
+
+  def seal(self):
+    #maps the file for reading
+    self.file.flush()
+    if self.size > 0:
+      self.mapping = mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ)
+    self.file.close()
+    return self
+
+  def __len__(self):
+    return len(self.starts)
+
+  def __load(self, i):
+    return pickle.loads(self.mapping[self.starts[i]:self.ends[i]])
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self.__load(i) for i in range(*index.indices(len(self)))]
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError('SpilledList index out of range')
+    return self.__load(index)
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self.__load(i)
+
+  def __eq__(self, other):
+    return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __reduce__(self):
+    #sending (or caching) a spilled list sends all of its values
+    return (list, (list(self),))
+
+def mapArray(directory, value):
+  #writes a NumPy array to a deleted file, and returns a read-only array
+  #mapped from it
+  spilled = scratchFile(directory)
+  with spilled:
+    numpy.ascontiguousarray(value).tofile(spilled)
+    spilled.flush()
+    return numpy.memmap(spilled, dtype=value.dtype, mode='r', shape=value.shape)
+
+class Spiller(object):
+  def __init__(self, directory, budget=None):
+    self.directory = directory
+    self.budget = budget if budget is not None else defaultBudget()
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+
+  def spill(self, value):
+    #returns the spilled form of the value, or None if it cannot be spilled
+    if numpy is not None and isinstance(value, array):
+      value = numpy.frombuffer(value, dtype=value.typecode)
+    if numpy is not None and isinstance(value, numpy.ndarray):
+      if value.dtype.hasobject or value.nbytes == 0:
+        return None
+      return mapArray(self.directory, value)
+    if isinstance(value, (list, tuple, array)):
+      spilled = SpilledList(self.directory, len(value))
+      spilled.place(0, len(value), value)
+      return spilled.seal()
+    return None
+
+  def enforce(self, scope):
+    #spills the largest items of the scope until it fits the budget;
+    #returns the names of the spilled items
+    sizes = dict((item, estimateSize(value)) for item, value in list(scope.items()))
+    total = sum(sizes.values())
+    spilled = []
+    for item in sorted(sizes, key=lambda item: -sizes[item]):
+      if total <= self.budget or sizes[item] < SPILL_MINIMUM:
+        break
+      value = self.spill(scope[item])
+      if value is not None:
+        scope[item] = value
+        total -= sizes[item]
+        spilled.append(item)
+    return spilled
+
+class SpillColumn(object):
+  #Column of a gathered output (see columns) that moves to a SpilledList
+  #once the output grows beyond what the budget has left
+  def __init__(self, spiller, available, column):
+    self.spiller = spiller
+    self.available = available  #bytes the column may take in memory
+    self.column = column
+    self.used = 0
+
+  def place(self, offset, count, values):
+    if not isinstance(self.column, SpilledList):
+      self.used += estimateSize(values)
+      if self.used > self.available:
+        #the values so far are moved to disk, the next ones go straight there
+        held = self.column.result()
+        spilled = SpilledList(self.spiller.directory, len(held))
+        for n_beg in range(0, len(held), 4096):
+          part = held[n_beg:n_beg+4096]
+          spilled.place(n_beg, len(part), part)
+        self.column = spilled
+    self.column.place(offset, count, values)
+
+  def result(self):
+    if isinstance(self.column, SpilledList):
+      return self.column.seal()
+    return self.column.result()
@@ -0,0 +1,160 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import tempfile
+
+import baseTasks
+
+INDEX_NAME = '.taskindex.json'
+INDEX_VERSION = 1
+
+def describeParams(params):
+  #printable, JSON-friendly form of the task's params: name, type name (or
+  #the list of allowed values of an enumerated param) and default, if any
+  described = []
+  for param in params:
+    if type(param[1]) is baseTasks.MuEnum:
+      kind = list(param[1].keys())
+    else:
+      #(the type may be any callable, like a function)
+      kind = getattr(param[1], '__name__', repr(param[1]))
+    described.append([param[0], kind] + [str(default) for default in param[2:]])
+  return described
+
+class TaskRecord(object):
+  #What the index knows about a task class: enough to list and describe it,
+  #and to find it when a script uses it. Calling the record constructs the
+  #task, like calling the class would - the module is only imported then.
+  def __init__(self, name, kind, module, cls, info, params, inputs, outputs):
+    self.name = name
+    self.kind = kind  #'serial', 'parallel' or 'reducer'
+    self.module = module
+    self.cls = cls  #name of the class in the module
+    self.info = info
+    self.params = params
+    self.inputs = inputs
+    self.outputs = outputs
+    self.task = None  #the class itself, once imported
+
+  @classmethod
+  def fromClass(cls, task, module):
+    if issubclass(task, baseTasks.BaseParallel):
+      kind = 'parallel'
+    elif issubclass(task, baseTasks.BaseReducer):
+      kind = 'reducer'
+    else:
+      kind = 'serial'
+    record = cls(task.name, kind, module, task.__name__, task.info,
+                 describeParams(task.params), list(task.inputs), list(task.outputs))
+    record.task = task
+    return record
+
+  @classmethod
+  def fromDict(cls, d):
+    return cls(d['name'], d['kind'], d['module'], d['cls'], d['info'],
+               d['params'], d['inputs'], d['outputs'])
+
+  def toDict(self):
+    return {
+      'name': self.name, 'kind': self.kind, 'module': self.module, 'cls': self.cls,
+      'info': self.info, 'params': self.params, 'inputs': self.inputs, 'outputs': self.outputs,
+    }
+
+  def load(self):
+    #returns the task class, importing its module if necessary
+    if self.task is None:
+      task = getattr(importlib.import_module(self.module), self.cls)
+      if not task.isValid:
+        task.validateParams()
+      task.module = self.module
+      self.task = task
+    return self.task
+
+  def __call__(self, *args, **kwargs):
+    return self.load()(*args, **kwargs)
+
+class TaskIndex(object):
+  #Persistent index of the tasks in a folder of task modules, kept in a JSON
+  #file in that folder. A module is only imported (and its tasks validated)
+  #if it is new or has changed since it was indexed - which is told by its
+  #modification time and size, or failing that, the digest of its contents.
+  #The folder is expected to be on sys.path already.
+  def __init__(self, path):
+    self.path = path
+    self.file = os.path.join(path, INDEX_NAME)
+
+  def __read(self):
+    try:
+      with open(self.file, 'r') as index_file:
+        index = json.load(index_file)
+    except (IOError, OSError, ValueError):
+      return {}
+    if index.get('version') != INDEX_VERSION:
+      return {}
+    return index['modules']
+
+  def __write(self, modules):
+    #the index is only an optimization - a folder that cannot be written to
+    #just means that the modules are inspected on every start
+    try:
+      fd, temp = tempfile.mkstemp(prefix='.', dir=self.path)
+      with os.fdopen(fd, 'w') as index_file:
+        json.dump({'version': INDEX_VERSION, 'modules': modules}, index_file, indent=1)
+      os.chmod(temp, 0o644)
+      os.rename(temp, self.file)
+    except (IOError, OSError):
+      pass
+
+  def inspectModule(self, module):
+    #imports the module and describes all the non-base task classes in it
+    records = []
+    tmod = importlib.import_module(module)
+    for name, obj in inspect.getmembers(tmod, inspect.isclass):
+      if (issubclass(obj, baseTasks.BaseProcessor) and not obj.isBase):
+        try:
+          if not obj.isValid:
+            obj.validateParams()
+        except baseTasks.BadParamException as e:
+          print(e.message + ' - skipping import')
+        else:
+          #add a string attribute identifying which module did the task come from
+          obj.module = module
+          records.append(TaskRecord.fromClass(obj, module))
+    return records
+
+  def scan(self):
+    #returns the records of all the tasks in the folder, updating the index
+    stored = self.__read()
+    modules = {}
+    loaded = []  #records of the modules imported just now
+    changed = False
+    for filename in sorted(os.listdir(self.path)):
+      path = os.path.join(self.path, filename)
+      if not (os.path.isfile(path) and filename.endswith('.py')):
+        continue
+      module = filename.split('.')[0]
+      stats = os.stat(path)
+      entry = stored.get(module)
+      if entry is None or entry['mtime'] != stats.st_mtime or entry['size'] != stats.st_size:
+        with open(path, 'rb') as source:
+          digest = hashlib.sha1(source.read()).hexdigest()
+        if entry is None or entry['sha1'] != digest:
+          records = self.inspectModule(module)
+          loaded += records
+          entry = {'sha1': digest, 'tasks': [record.toDict() for record in records]}
+        entry['mtime'] = stats.st_mtime
+        entry['size'] = stats.st_size
+        changed = True
+      modules[module] = entry
+    if changed or len(modules) != len(stored):
+      self.__write(modules)
+    #records of the modules that had to be imported already know their classes
+    loaded = dict(((record.module, record.cls), record) for record in loaded)
+    records = []
+    for module in sorted(modules.keys()):
+      for d in modules[module]['tasks']:
+        record = TaskRecord.fromDict(d)
+        records.append(loaded.get((record.module, record.cls), record))
+    return records
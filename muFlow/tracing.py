@@ -0,0 +1,74 @@
+import json
+import os
+import threading
+import time
+
+class Trace(object):
+  #Collects spans of time spent on tasks and data transfers, in all the
+  #processes, and saves them in the Chrome trace event format - the file can
+  #be opened in chrome://tracing or https://ui.perfetto.dev. Each process
+  #(the parent and every worker) records its own spans; workers send theirs
+  #to the parent along with the messages that complete their chunks.
+  #Spans of the parallel tasks are aggregated per chunk: instead of one span
+  #for every item, each task gets a single span per chunk, as long as the
+  #total time it took on the chunk's items.
+  def __init__(self):
+    self.events = []
+    self.processes = {os.getpid(): 'muFlow'}
+    self.lock = threading.Lock()  #tasks may run in multiple threads
+
+  def add(self, name, category, start, end, **args):
+    #records a span between the given points in time (as from time.time())
+    event = {
+      'name': name,
+      'cat': category,
+      'ph': 'X',
+      'ts': start * 1e6,
+      'dur': (end - start) * 1e6,
+      'pid': os.getpid(),
+      'tid': threading.current_thread().ident,
+    }
+    if len(args) > 0:
+      event['args'] = args
+    with self.lock:
+      self.events.append(event)
+
+  def take(self):
+    #removes and returns the spans recorded so far
+    with self.lock:
+      events, self.events = self.events, []
+    return events
+
+  def merge(self, events, process):
+    #adds the spans recorded by another process, naming that process
+    with self.lock:
+      self.events += events
+      for event in events:
+        self.processes.setdefault(event['pid'], process)
+
+  def save(self, path):
+    #timestamps are made relative to the earliest span
+    events = self.take()
+    origin = min(event['ts'] for event in events) if len(events) > 0 else 0
+    for event in events:
+      event['ts'] -= origin
+    for pid, name in self.processes.items():
+      events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': name}})
+    with open(path, 'w') as trace_file:
+      json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+class Span(object):
+  #Context manager recording a span in the given trace, if there is one
+  def __init__(self, trace, name, category, **args):
+    self.trace = trace
+    self.name = name
+    self.category = category
+    self.args = args
+
+  def __enter__(self):
+    self.start = time.time()
+    return self
+
+  def __exit__(self, *exc):
+    if self.trace is not None:
+      self.trace.add(self.name, self.category, self.start, time.time(), **self.args)
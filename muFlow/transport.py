@@ -0,0 +1,206 @@
+import marshal
+import mmap
+import os
+import pickle
+import struct
+import sys
+import tempfile
+import zlib
+
+#####Optional dependencies#####
+try:
+  import lz4.frame as lz4
+except ImportError:
+  lz4 = None
+
+#Data exchanged between the parent and the worker processes goes through
+#send() and recv() of this module rather than directly through the pipes.
+#Since Python 3.8, objects that expose their memory to pickle protocol 5 -
+#most notably NumPy arrays, but also pickle.PickleBuffer - are serialized
+#out-of-band: a buffer of at least SHARED_THRESHOLD bytes is copied once into
+#a memory-mapped file in shared memory, and the receiving side reconstructs
+#the object as a view of that mapping instead of unpickling yet another copy.
+#Everything else (and all data on older Pythons, or sent to connections marked
+#as remote) is pickled as usual.
+#How the messages are serialized is chosen by a codec: 'pickle' (as above),
+#or 'marshal' - more compact and faster for plain data (numbers, strings,
+#lists, dicts...), with messages holding anything else pickled after all
+#(marshal would write objects with a buffer, like NumPy values or arrays,
+#as plain bytes). Either can be followed by a compression of the large messages, like
+#'pickle+zlib' or 'marshal+lz4' (LZ4 if installed, zlib otherwise).
+OUT_OF_BAND = sys.version_info >= (3, 8)
+SHARED_THRESHOLD = 1 << 20
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+#the files are named after the channel they are sent over (see Channel and
+#WorkerPool), so that those never received can be found and removed
+SHARED_PREFIX = 'muflow-'
+PICKLE_PROTOCOL = 5 if OUT_OF_BAND else pickle.HIGHEST_PROTOCOL
+SERIALIZERS = ('pickle', 'marshal')
+COMPRESSORS = (None, 'zlib', 'lz4')
+COMPRESS_THRESHOLD = 64 << 10
+DEFAULT_CODEC = 'pickle'
+#the exact types that marshal restores as they were
+MARSHAL_TYPES = set([int, float, complex, str, bytes, bool, type(None), list, tuple, dict,
+                     set, frozenset])
+if sys.version_info < (3,0):
+  MARSHAL_TYPES.update([long, unicode])
+CONTAINERS = (list, tuple, set, frozenset)
+
+def parseCodec(codec):
+  #returns the serializer and the compressor (or None) of the codec
+  parts = (codec or DEFAULT_CODEC).split('+')
+  compressor = parts[1] if len(parts) == 2 else None
+  if len(parts) > 2 or parts[0] not in SERIALIZERS or compressor not in COMPRESSORS:
+    raise ValueError('unknown codec "{}"'.format(codec))
+  if compressor == 'lz4' and lz4 is None:
+    compressor = 'zlib'
+  return parts[0], compressor
+
+class ByteCounter(object):
+  #counts the messages and bytes going through send() and recv()
+  def __init__(self):
+    self.messages = 0
+    self.sent = 0
+    self.received = 0
+
+class Channel(object):
+  #A connection along with how the data is to be sent over it: the files of
+  #shared buffers are named with the prefix, and remote connections (to other
+  #machines) never share memory. (Connections themselves cannot be given
+  #attributes on Python 2.) It can be used in place of the connection, also
+  #to wait for data (see scheduler.waitPipes).
+  def __init__(self, conn, prefix=SHARED_PREFIX, remote=False):
+    self.conn = conn
+    self.prefix = prefix
+    self.remote = remote
+
+  def send(self, obj):
+    self.conn.send(obj)
+
+  def recv(self):
+    return self.conn.recv()
+
+  def send_bytes(self, data):
+    self.conn.send_bytes(data)
+
+  def recv_bytes(self):
+    return self.conn.recv_bytes()
+
+  def fileno(self):
+    return self.conn.fileno()
+
+  def close(self):
+    self.conn.close()
+
+def marshallable(obj):
+  #whether the object is made of MARSHAL_TYPES only (checked without recursion,
+  #as the containers may be nested deeply)
+  pending = [obj]
+  while len(pending) > 0:
+    value = pending.pop()
+    kind = type(value)
+    if kind not in MARSHAL_TYPES:
+      return False
+    if kind is dict:
+      pending.extend(value.keys())
+      pending.extend(value.values())
+    elif kind in CONTAINERS:
+      pending.extend(value)
+  return True
+
+def share(buffer, prefix=SHARED_PREFIX):
+  #copies the buffer into a new memory-mapped file and returns its description
+  fd, path = tempfile.mkstemp(prefix=prefix, dir=SHARED_DIR)
+  try:
+    os.ftruncate(fd, buffer.nbytes)
+    mapping = mmap.mmap(fd, buffer.nbytes)
+    mapping[:] = buffer
+    mapping.close()
+  finally:
+    os.close(fd)
+  return path, buffer.nbytes
+
+def release(prefix):
+  #removes the files of shared buffers with the given prefix - those of the
+  #messages that were sent, but will never be received
+  for name in os.listdir(SHARED_DIR):
+    if name.startswith(prefix):
+      try:
+        os.remove(os.path.join(SHARED_DIR, name))
+      except OSError:
+        pass
+
+def attach(path, size):
+  #maps a file created by share() - the file is removed right away, but the
+  #memory stays available for as long as anything refers to the mapping
+  fd = os.open(path, os.O_RDWR)
+  try:
+    mapping = mmap.mmap(fd, size)
+  finally:
+    os.close(fd)
+    os.unlink(path)
+  return mapping
+
+def send(conn, obj, codec=None, counter=None):
+  serializer, compressor = parseCodec(codec)
+  payload = None
+  if serializer == 'marshal':
+    if marshallable(obj):
+      payload = marshal.dumps(obj)
+    else:
+      serializer = 'pickle'
+  shared = []
+  if payload is None:
+    #there is no memory to share with other machines
+    payload, shared = serialize(obj, not getattr(conn, 'remote', False),
+                                getattr(conn, 'prefix', SHARED_PREFIX))
+  if compressor is not None and len(payload) >= COMPRESS_THRESHOLD:
+    payload = zlib.compress(payload, 1) if compressor == 'zlib' else lz4.compress(payload)
+  else:
+    compressor = None
+  #the receiver first learns how the message is encoded, and where the
+  #out-of-band buffers are, then gets the rest
+  header = struct.pack('BB', SERIALIZERS.index(serializer), COMPRESSORS.index(compressor))
+  if len(shared) > 0:
+    header += pickle.dumps(shared, protocol=PICKLE_PROTOCOL)
+  conn.send_bytes(header)
+  conn.send_bytes(payload)
+  if counter is not None:
+    counter.messages += 1
+    counter.sent += len(header) + len(payload) + sum(size for _, size in shared)
+
+def serialize(obj, shared=True, prefix=SHARED_PREFIX):
+  #returns the pickled object and the descriptions of its shared buffers
+  if not (OUT_OF_BAND and shared):
+    return pickle.dumps(obj, protocol=PICKLE_PROTOCOL), []
+  buffers = []
+  def inBand(buffer):
+    #small and non-contiguous buffers are cheaper to pickle along with the rest
+    try:
+      raw = buffer.raw()
+    except BufferError:
+      return True
+    if raw.nbytes < SHARED_THRESHOLD:
+      return True
+    buffers.append(raw)
+    return False
+  payload = pickle.dumps(obj, protocol=5, buffer_callback=inBand)
+  return payload, [share(buffer, prefix) for buffer in buffers]
+
+def recv(conn, counter=None):
+  header = conn.recv_bytes()
+  payload = conn.recv_bytes()
+  serializer, compressor = struct.unpack('BB', header[:2])
+  shared = pickle.loads(header[2:]) if len(header) > 2 else []
+  if counter is not None:
+    counter.messages += 1
+    counter.received += len(header) + len(payload) + sum(size for _, size in shared)
+  if COMPRESSORS[compressor] == 'zlib':
+    payload = zlib.decompress(payload)
+  elif COMPRESSORS[compressor] == 'lz4':
+    payload = lz4.decompress(payload)
+  if SERIALIZERS[serializer] == 'marshal':
+    return marshal.loads(payload)
+  if len(shared) > 0:
+    return pickle.loads(payload, buffers=[attach(path, size) for path, size in shared])
+  return pickle.loads(payload)
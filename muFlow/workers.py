@@ -0,0 +1,221 @@
+import multiprocessing as mp
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import transport
+from errors import *
+
+def serveJobs(pipe, jobs, inboxes=None, counters=None):
+  #main loop of a worker: run the announced jobs until told to quit
+  #remote workers have neither the inboxes of the others nor shared counters
+  #the spans the parent recorded before the fork are not the worker's to send
+  for job in jobs:
+    if job.macro.trace is not None:
+      job.macro.trace.take()
+  while True:
+    try:
+      message = pipe.recv()
+    except EOFError:
+      #the parent is gone, or stopped the workers after a failure
+      break
+    if message is None:
+      break
+    job, rank, peers = message
+    try:
+      if inboxes is None:
+        jobs[job].sequence(pipe, rank, None, ([0], 0))
+      else:
+        jobs[job].sequence(pipe, rank, [inboxes[i] for i in peers], (counters, peers[rank]))
+    except (EOFError, IOError):
+      #the parent went away in the middle of the job
+      break
+
+class WorkerPool(object):
+  #A set of long-lived worker processes, each connected to the parent by its
+  #own duplex pipe. The pool is forked once, after all the tasks have been set
+  #up, so every worker inherits the complete list of MicroFlows (jobs) and the
+  #tasks never have to be sent over. To run a MicroFlow, the parent announces
+  #its job number to the workers, which then take part in that MicroFlow's
+  #exchange of data (see MicroFlow.sequence) and wait for the next job.
+  #MicroFlows running at the same time divide the workers among themselves,
+  #each acquiring a subset of idle ones and releasing them when done.
+  remote = False  #whether the workers are on other machines (see RemotePool)
+
+  def __init__(self, jobs, num_proc):
+    self.jobs = jobs
+    self.pipes = []
+    self.processes = []
+    self.lock = threading.Condition()
+    #buffers shared over the pipes of the pool are named after it, so that
+    #those left behind by a failed run can be removed (see terminate)
+    self.prefix = '{}{}-{}-'.format(transport.SHARED_PREFIX, os.getpid(), id(self))
+    #every worker can be sent data by the others
+    self.inboxes = [Inbox(self.prefix) for i in range(num_proc)]
+    #and counts the items it has done in its own slot, for progress reports
+    self.counters = mp.RawArray('l', num_proc)
+    for i in range(num_proc):
+      a, b = mp.Pipe(True)  #duplex pipe - we send data and receive results
+      a, b = transport.Channel(a, self.prefix), transport.Channel(b, self.prefix)
+      #(not daemonic, so that tasks may start processes of their own - the
+      #workers are stopped by close or terminate, or quit once the parent is
+      #gone, see serve)
+      process = mp.Process(target=self.serve, args=(b, a))
+      process.start()
+      #the worker's end is not needed here; closing it lets the parent notice
+      #when a worker dies, instead of waiting for its data forever
+      b.close()
+      self.pipes.append(a)
+      self.processes.append(process)
+    self.idle = list(self.pipes)
+
+  def serve(self, pipe, parent_end):
+    #the parent's ends of the pipes (of this worker, and of those forked
+    #before it) are inherited, but must not stay open here - only then does
+    #the worker notice when the parent is gone
+    parent_end.close()
+    for other in self.pipes:
+      other.close()
+    serveJobs(pipe, self.jobs, self.inboxes, self.counters)
+
+  def acquire(self, count=None):
+    #reserve up to count idle workers (all idle ones if None), waiting until
+    #at least one is available; returns the pipes of the reserved workers
+    with self.lock:
+      while len(self.idle) == 0:
+        self.lock.wait()
+      if count is None:
+        count = len(self.idle)
+      taken, self.idle = self.idle[:count], self.idle[count:]
+      return taken
+
+  def release(self, pipes):
+    with self.lock:
+      self.idle += pipes
+      self.lock.notify_all()
+
+  def run(self, micro, pipes):
+    #start a MicroFlow on the given workers, ranking them in order; each of
+    #them also learns which inboxes belong to the others (in order of rank)
+    job = self.jobs.index(micro)
+    peers = [self.pipes.index(pipe) for pipe in pipes]
+    for rank, pipe in enumerate(pipes):
+      pipe.send((job, rank, peers))
+
+  def close(self):
+    for pipe in self.pipes:
+      pipe.send(None)
+    for process in self.processes:
+      process.join()
+    self.pipes = []
+    self.processes = []
+
+  def terminate(self):
+    #stop the workers immediately, whatever they are doing
+    for process in self.processes:
+      process.terminate()
+    for process in self.processes:
+      process.join()
+    self.pipes = []
+    self.processes = []
+    #the data sent by either side, but not received, is still in memory
+    transport.release(self.prefix)
+
+def parseAddress(address):
+  #'host:port' into a (host, port) tuple
+  if isinstance(address, tuple):
+    return address
+  host, _, port = address.rpartition(':')
+  return (host or 'localhost', int(port))
+
+def encodeKey(authkey):
+  return authkey.encode('utf-8') if not isinstance(authkey, bytes) else authkey
+
+class RemotePool(WorkerPool):
+  #Workers on other machines (or just other processes), which connect to the
+  #parent (the coordinator) over TCP - see MacroFlow.serve. The coordinator
+  #listens on the given address until all the workers are connected, then
+  #sends each of them the script to assemble and set up, so that they end
+  #up with the same list of MicroFlows (jobs) as the coordinator. From then
+  #on, the workers are used just like the local ones, except that:
+  #- the data is never passed through shared memory (see transport)
+  #- the workers cannot send data to each other, so there is no tree reduction
+  #- the items done are counted by the coordinator, from the parts received
+  #The connections are authenticated with the key (as by multiprocessing),
+  #which both sides must know - whoever has it can run code on the other side.
+  remote = True
+
+  def __init__(self, jobs, address, count, authkey, script):
+    self.jobs = jobs
+    self.pipes = []
+    self.processes = []
+    self.lock = threading.Condition()
+    self.inboxes = None
+    self.counters = [0] * count
+    self.listener = Listener(parseAddress(address), authkey=encodeKey(authkey))
+    try:
+      addresses = []
+      for i in range(count):
+        conn = transport.Channel(self.listener.accept(), remote=True)
+        conn.send(script)
+        self.pipes.append(conn)
+        addresses.append(self.listener.last_accepted)
+      #each worker reports once it has assembled and set up the script
+      for conn, worker in zip(self.pipes, addresses):
+        reply = conn.recv()
+        if reply[0] != 'ready':
+          raise RemoteException(worker, reply[1])
+    except:
+      self.terminate()
+      raise
+    self.idle = list(self.pipes)
+
+  def close(self):
+    for pipe in self.pipes:
+      pipe.send(None)
+    self.terminate()
+
+  def terminate(self):
+    #the workers notice the connection is closed and quit
+    for pipe in self.pipes:
+      pipe.close()
+    self.pipes = []
+    self.listener.close()
+
+def connect(address, authkey, timeout=60.0):
+  #connects a remote worker to the coordinator, retrying until it listens;
+  #returns the connection and the script (lines and options) to assemble
+  address = parseAddress(address)
+  start = time.time()
+  while True:
+    try:
+      conn = Client(address, authkey=encodeKey(authkey))
+      break
+    except (IOError, OSError):
+      if time.time() - start > timeout:
+        raise RemoteException(address, 'no coordinator is listening')
+      time.sleep(0.2)
+  conn = transport.Channel(conn, remote=True)
+  return conn, conn.recv()
+
+class Inbox(object):
+  #Receiving end of the data sent to one worker by the others. Any worker may
+  #send, so the senders take turns, and the data is tagged with the sender's
+  #rank - the owner asks for the data of a particular sender, keeping anything
+  #that arrives earlier from the others until it is asked for.
+  def __init__(self, prefix=transport.SHARED_PREFIX):
+    self.reader, writer = mp.Pipe(False)
+    self.writer = transport.Channel(writer, prefix)
+    self.lock = mp.Lock()
+    self.pending = {}
+
+  def send(self, sender, obj):
+    with self.lock:
+      transport.send(self.writer, (sender, obj))
+
+  def recv(self, sender):
+    while sender not in self.pending:
+      source, obj = transport.recv(self.reader)
+      self.pending[source] = obj
+    return self.pending.pop(sender)
@@ -1,9 +1,22 @@
+import json
+import os
+import shutil
+import tempfile
+import time
 import unittest
+from array import array
 import sys
 sys.path.append('../muFlow')
 import assembler as asm
 import baseTasks as bt
 from errors import *
+try:
+  import numpy
+except ImportError:
+  numpy = None
+#coroutine actions need Python 3.5+
+if asm.asyncRunner is not None:
+  import asyncTasks
 
 class TestImport(unittest.TestCase):
   assembler = asm.Assembler('../test/tasks')
@@ -26,6 +39,55 @@ class TestImport(unittest.TestCase):
     self.assertEqual(len(a.tasks_reducer.keys()), 1)
     self.assertIn('reduce_sum', a.tasks_reducer.keys())
 
+  def test_lazyImport(self):
+    path = tempfile.mkdtemp()
+    source = os.path.join(path, 'lazyTasks.py')
+    task = 'from baseTasks import BaseProcessor\nclass Lazy(BaseProcessor):\n  name = "{}"\n'
+    try:
+      with open(source, 'w') as module:
+        module.write(task.format('lazy1'))
+      asm.Assembler(path)
+      #the module is not imported again, unless a script uses its task
+      del sys.modules['lazyTasks']
+      a = asm.Assembler(path)
+      self.assertIn('lazy1', a.tasks_serial.keys())
+      self.assertNotIn('lazyTasks', sys.modules)
+      a.assembleFromText(['lazy1'])
+      self.assertIn('lazyTasks', sys.modules)
+      #a modified module is indexed anew
+      del sys.modules['lazyTasks']
+      with open(source, 'w') as module:
+        module.write(task.format('lazy_two'))
+      a = asm.Assembler(path)
+      self.assertIn('lazy_two', a.tasks_serial.keys())
+    finally:
+      shutil.rmtree(path)
+      sys.path.remove(path)
+      sys.modules.pop('lazyTasks', None)
+      #the tasks are listed for all Assemblers
+      asm.Assembler.tasks_serial.pop('lazy1', None)
+      asm.Assembler.tasks_serial.pop('lazy_two', None)
+  def test_functionParam(self):
+    path = tempfile.mkdtemp()
+    task = ('from baseTasks import BaseProcessor\n'
+            'def positive(text):\n  return max(1, int(text))\n'
+            'class Counted(BaseProcessor):\n  name = "counted"\n'
+            '  params = [("n", positive, "1"), ("scale", lambda text: float(text), "1")]\n'
+            '  outputs = ["n"]\n  def action(self):\n    return self.n\n')
+    try:
+      with open(os.path.join(path, 'functionTasks.py'), 'w') as module:
+        module.write(task)
+      a = asm.Assembler(path)
+      self.assertEqual(a.tasks_serial['counted'].params,
+                       [['n', 'positive', '1'], ['scale', '<lambda>', '1']])
+      self.assertEqual(a.assembleFromText(['counted -5']).execute()['n'], 1)
+    finally:
+      shutil.rmtree(path)
+      sys.path.remove(path)
+      sys.modules.pop('functionTasks', None)
+      #the tasks are listed for all Assemblers
+      asm.Assembler.tasks_serial.pop('counted', None)
+
 class TestAssembler(unittest.TestCase):
   a = asm.Assembler('../test/tasks')
   def test_setupTask(self):
@@ -135,6 +197,1021 @@ class TestMicroFlow(unittest.TestCase):
     uFlow.setup()
     result = uFlow.action(parent.scope['items'])
     self.assertEqual(result, expected)
+  def test_dynamicSchedule(self):
+    class TaskParallelSquare(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['items']
+      def action(self, x):
+        return x * x
+    test_data = list(range(1000))
+    expected  = [x * x for x in test_data]
+    parent = asm.MacroFlow() # dummy MacroFlow
+    parent.scope = {'items': test_data}
+    uFlow = asm.MicroFlow(parent, num_proc=4, schedule='dynamic')
+    uFlow.append(TaskParallelSquare())
+    uFlow.gather('items')
+    uFlow.setup()
+    result = uFlow.action(parent.scope['items'])
+    self.assertEqual(result, expected)
+  def test_streamedParts(self):
+    class TaskParallelSplit(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['halves', 'doubles']
+      def action(self, x):
+        return x / 2.0, x * 2
+    test_data = list(range(100))
+    parent = asm.MacroFlow() # dummy MacroFlow
+    parent.scope = {'items': test_data}
+    uFlow = asm.MicroFlow(parent, num_proc=3, stream_size=7)
+    uFlow.append(TaskParallelSplit())
+    uFlow.gather('halves')
+    uFlow.gather('doubles')
+    uFlow.setup()
+    halves, doubles = uFlow.action(parent.scope['items'])
+    self.assertEqual(halves, [x / 2.0 for x in test_data])
+    self.assertEqual(doubles, [x * 2 for x in test_data])
+  def test_lazyInputs(self):
+    class TaskParallelAdd(bt.BaseParallel):
+      inputs = ['items', 'others']
+      outputs = ['items']
+      def action(self, x, y):
+        return x + y
+    consumed = []
+    def generate(count):
+      for i in range(count):
+        consumed.append(i)
+        yield i
+    parent = asm.MacroFlow() # dummy MacroFlow
+    parent.scope = {'items': None, 'others': None}
+    for schedule in asm.MicroFlow.schedules:
+      uFlow = asm.MicroFlow(parent, num_proc=2, schedule=schedule, stream_size=5)
+      uFlow.append(TaskParallelAdd())
+      uFlow.gather('items')
+      uFlow.setup()
+      result = uFlow.action(generate(50), list(range(0, 100, 2)))
+      self.assertEqual(result, [3 * i for i in range(50)])
+    #in debug mode, the generator is not consumed beyond the first item
+    del consumed[:]
+    uFlow = asm.MicroFlow(parent, debug=True)
+    uFlow.append(TaskParallelAdd())
+    uFlow.gather('items')
+    uFlow.setup()
+    self.assertEqual(uFlow.action(generate(50), generate(50)), [0])
+    self.assertEqual(consumed, [0, 0])
+  def test_batchAction(self):
+    class TaskBatchSplit(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['halves', 'sizes']
+      def action_batch(self, xs):
+        return [x / 2.0 for x in xs], [len(xs)] * len(xs)
+    class TaskItemScale(bt.BaseParallel):
+      inputs = ['halves']
+      outputs = ['items']
+      def action(self, x):
+        return x * 5
+    test_data = list(range(100))
+    parent = asm.MacroFlow() # dummy MacroFlow
+    parent.scope = {'items': test_data}
+    uFlow = asm.MicroFlow(parent, num_proc=1, stream_size=32)
+    uFlow.append(TaskBatchSplit())
+    uFlow.append(TaskItemScale())
+    uFlow.gather('items')
+    uFlow.gather('sizes')
+    uFlow.setup()
+    result, sizes = uFlow.action(parent.scope['items'])
+    self.assertEqual(result, [x * 2.5 for x in test_data])
+    #the batches are bounded by stream_size
+    self.assertEqual(sizes, [32] * 96 + [4] * 4)
+  @unittest.skipUnless(numpy, 'requires NumPy')
+  def test_batchArrays(self):
+    class TaskBatchScale(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['items']
+      batchArrays = True
+      def action_batch(self, xs):
+        assert isinstance(xs, numpy.ndarray) and xs.shape[1] == 2
+        return xs * 3
+    test_data = [numpy.array([i, -i]) for i in range(50)]
+    parent = asm.MacroFlow() # dummy MacroFlow
+    parent.scope = {'items': test_data}
+    uFlow = asm.MicroFlow(parent, num_proc=2, schedule='dynamic', stream_size=8)
+    uFlow.append(TaskBatchScale())
+    uFlow.gather('items')
+    uFlow.setup()
+    result = uFlow.action(parent.scope['items'])
+    self.assertEqual([list(x) for x in result], [[3 * i, -3 * i] for i in range(50)])
+  def test_progressCounters(self):
+    class TaskParallelSquare(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['items']
+      def action(self, x):
+        return x * x
+    parent = asm.MacroFlow() # dummy MacroFlow
+    parent.scope = {'items': list(range(300))}
+    for schedule in asm.MicroFlow.schedules:
+      uFlow = asm.MicroFlow(parent, num_proc=3, schedule=schedule, stream_size=16)
+      uFlow.append(TaskParallelSquare())
+      uFlow.gather('items')
+      uFlow.setup()
+      uFlow.action(parent.scope['items'])
+      #every worker counted the items it has done
+      reporter = uFlow.reporter
+      self.assertEqual(sum(reporter.counters[slot] for slot in reporter.slots), 300)
+      self.assertIn('100% done', reporter.report())
+  def test_progressReport(self):
+    counters = [0, 0, 0]
+    reporter = asm.progress.ParallelReporter('Task')
+    reporter.setup(100, counters, [0, 2])
+    counters[0], counters[2] = 30, 10
+    reporter.start -= 2.0
+    report = reporter.report()
+    self.assertTrue(report.startswith('Task,  40% done, 20 items/s, ETA 3s, lag 20 items'))
+    #with unknown total, neither the percentage nor the ETA can be estimated
+    reporter.setup(None, counters, [0])
+    counters[0] = 5
+    self.assertNotIn('ETA', reporter.report())
+  def test_unknownSchedule(self):
+    with self.assertRaises(ConstructException):
+      asm.MicroFlow(asm.MacroFlow(), schedule='random')
+  @unittest.skipIf(asm.futures is None, 'requires concurrent.futures')
+  def test_backends(self):
+    class TaskParallelPid(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['items', 'pids']
+      def action(self, x):
+        return x * x, os.getpid()
+    test_data = list(range(500))
+    parent = asm.MacroFlow() # dummy MacroFlow
+    parent.scope = {'items': test_data}
+    for backend in asm.MicroFlow.backends:
+      for batched in (False, True):
+        uFlow = asm.MicroFlow(parent, num_proc=2, stream_size=16, backend=backend, threads=3)
+        task = TaskParallelPid()
+        if batched:
+          task.action_batch = lambda xs: ([x * x for x in xs], [os.getpid()] * len(xs))
+        uFlow.append(task)
+        uFlow.gather('items')
+        uFlow.gather('pids')
+        uFlow.setup()
+        result, pids = uFlow.action(parent.scope['items'])
+        self.assertEqual(result, [x * x for x in test_data])
+        #only the thread backend runs the tasks in this very process
+        self.assertEqual(set(pids) == set([os.getpid()]), backend == 'thread')
+        reporter = uFlow.reporter
+        self.assertEqual(sum(reporter.counters[slot] for slot in reporter.slots), 500)
+  @unittest.skipUnless(asm.asyncRunner, 'requires Python 3.5+')
+  def test_asyncAction(self):
+    class TaskIncrement(bt.BaseParallel):
+      inputs = ['fetched']
+      outputs = ['items']
+      def action(self, x):
+        return x + 1
+    test_data = list(range(200))
+    parent = asm.MacroFlow() # dummy MacroFlow
+    parent.scope = {'items': test_data}
+    for backend in asm.MicroFlow.backends:
+      uFlow = asm.MicroFlow(parent, num_proc=2, stream_size=8, backend=backend, threads=2,
+                            in_flight=10)
+      uFlow.append(asyncTasks.TaskAsyncFetch())
+      uFlow.append(TaskIncrement())
+      uFlow.gather('items')
+      uFlow.gather('active')
+      uFlow.setup()
+      self.assertTrue(uFlow.asynchronous)
+      result, active = uFlow.action(parent.scope['items'])
+      self.assertEqual(result, [2 * x + 1 for x in test_data])
+      #the items were in flight at once, but no more than allowed
+      self.assertEqual(max(active), 10)
+  def test_workerFailure(self):
+    class TaskParallelInverse(bt.BaseParallel):
+      name = 'inverse'
+      inputs = ['items']
+      outputs = ['inverses']
+      def action(self, x):
+        return 1.0 / (x - 37)
+    class TaskParallelExit(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['items']
+      def action(self, x):
+        os._exit(1)
+    parent = asm.MacroFlow() # dummy MacroFlow
+    parent.scope = {'items': list(range(1000))}
+    for backend in asm.MicroFlow.backends:
+      for batched in (False, True):
+        uFlow = asm.MicroFlow(parent, num_proc=2, stream_size=16, backend=backend, threads=2)
+        task = TaskParallelInverse()
+        if batched:
+          task.action_batch = lambda xs: [1.0 / (x - 37) for x in xs]
+        uFlow.append(task)
+        uFlow.gather('inverses')
+        uFlow.setup()
+        with self.assertRaises(WorkerException) as raised:
+          uFlow.action(parent.scope['items'])
+        error = raised.exception
+        self.assertEqual(error.taskname, task.name)
+        #a batch is reported as a whole
+        self.assertEqual(error.index, 32 if batched else 37)
+        self.assertEqual(error.count, 16 if batched else 1)
+        self.assertIn('ZeroDivisionError', error.text)
+        self.assertIn('1.0 / (x - 37)', error.text)
+    #a worker that dies without a word fails the run too
+    uFlow = asm.MicroFlow(parent, num_proc=2)
+    uFlow.append(TaskParallelExit())
+    uFlow.gather('items')
+    uFlow.setup()
+    with self.assertRaises(WorkerException):
+      uFlow.action(list(range(10)))
+  def test_skipErrors(self):
+    class TaskParallelInverse(bt.BaseParallel):
+      name = 'inverse'
+      inputs = ['items']
+      outputs = ['inverses']
+      skip_errors = True
+      def action(self, x):
+        return 1.0 / (x % 100 - 37)
+    class TaskParallelDouble(bt.BaseParallel):
+      inputs = ['inverses']
+      outputs = ['doubles']
+      def action(self, x):
+        return 2 * x
+    test_data = list(range(1000))
+    parent = asm.MacroFlow() # dummy MacroFlow
+    parent.scope = {'items': test_data}
+    for backend in asm.MicroFlow.backends:
+      uFlow = asm.MicroFlow(parent, num_proc=2, stream_size=16, backend=backend, threads=2)
+      uFlow.append(TaskParallelInverse())
+      uFlow.append(TaskParallelDouble())
+      uFlow.gather('doubles')
+      uFlow.setup()
+      result = uFlow.action(test_data)
+      failing = [x for x in test_data if x % 100 == 37]
+      #the failing items have no outputs, the others are not affected
+      self.assertEqual([x for x, value in zip(test_data, result) if value is None], failing)
+      self.assertEqual(result[36], -2.0)
+      self.assertEqual([index for _, index, _, _ in uFlow.skipped], failing)
+      self.assertTrue(all('ZeroDivisionError' in text for _, _, _, text in uFlow.skipped))
+      self.assertIn('10 item(s) skipped', uFlow.summary())
+      #the failures of a run are not carried over to the next one
+      uFlow.action(test_data[:30])
+      self.assertEqual(uFlow.skipped, [])
+    if asm.asyncRunner is not None:
+      #coroutines fail and are skipped the same way
+      task = asyncTasks.TaskAsyncInverse()
+      uFlow = asm.MicroFlow(parent, num_proc=2, stream_size=16, in_flight=8)
+      uFlow.append(task)
+      uFlow.gather('inverses')
+      uFlow.setup()
+      result = uFlow.action(test_data)
+      self.assertEqual([x for x, value in zip(test_data, result) if value is None], failing)
+      task.skip_errors = False
+      with self.assertRaises(WorkerException) as raised:
+        uFlow.action(test_data)
+      self.assertEqual(raised.exception.index % 100, 37)
+  def test_failureStopsWorkers(self):
+    class TaskParallelCheck(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['items']
+      def action(self, x):
+        if x == 3:
+          raise ValueError('bad item')
+        time.sleep(0.01)
+        return x
+    flow = asm.MacroFlow(num_proc=2, schedule='dynamic')
+    flow.scope['items'] = list(range(10000))
+    flow.appendParallel(TaskParallelCheck())
+    flow.completeParallel()
+    start = time.time()
+    with self.assertRaises(WorkerException) as raised:
+      flow.execute()
+    #the rest of the items (50s worth) were not waited for
+    self.assertLess(time.time() - start, 10.0)
+    self.assertEqual(raised.exception.index, 3)
+    self.assertIn('bad item', raised.exception.message)
+    self.assertIsNone(flow.pool)
+  @unittest.skipUnless(numpy is not None and asm.transport.OUT_OF_BAND,
+                       'requires NumPy and pickle protocol 5')
+  def test_failureReleasesShared(self):
+    class TaskParallelLarge(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['arrays']
+      def action(self, x):
+        #the first worker starts sending parts just as the second one fails
+        if x in (0, 21):
+          time.sleep(0.3)
+        if x == 21:
+          raise ValueError('bad item')
+        return numpy.zeros(300000)
+    def leftovers():
+      return set(name for name in os.listdir(asm.transport.SHARED_DIR) if name.startswith('muflow-'))
+    before = leftovers()
+    parent = asm.MacroFlow() # dummy MacroFlow
+    parent.scope = {'items': list(range(40))}
+    uFlow = asm.MicroFlow(parent, num_proc=2, stream_size=1)
+    uFlow.append(TaskParallelLarge())
+    uFlow.gather('arrays')
+    uFlow.setup()
+    with self.assertRaises(WorkerException):
+      uFlow.action(parent.scope['items'])
+    self.assertEqual(leftovers() - before, set())
+  @unittest.skipIf(asm.futures is None, 'requires concurrent.futures')
+  def test_taskBackend(self):
+    class TaskThreaded(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['items']
+      backend = 'thread'
+    class TaskProcess(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['items']
+      backend = 'process'
+    parent = asm.MacroFlow() # dummy MacroFlow
+    for tasks, expected in (([TaskThreaded()], 'thread'), ([bt.BaseParallel()], 'hybrid'),
+                            ([TaskThreaded(), TaskProcess()], 'hybrid')):
+      uFlow = asm.MicroFlow(parent, backend='hybrid')
+      for task in tasks:
+        uFlow.append(task)
+      uFlow.setup()
+      self.assertEqual(uFlow.backend, expected)
+    with self.assertRaises(ConstructException):
+      asm.MicroFlow(parent, backend='green')
+
+class TestColumns(unittest.TestCase):
+  def test_typedColumns(self):
+    for values, typecode in (([0.5 * i for i in range(10)], 'd'), (list(range(10)), asm.columns.INT_CODE)):
+      column = asm.columns.TypedColumn(10)
+      column.place(6, 4, values[6:])
+      column.place(0, 6, values[:6])
+      result = column.result()
+      self.assertEqual(result.typecode, typecode)
+      self.assertEqual(list(result), values)
+  def test_fallbackToList(self):
+    column = asm.columns.TypedColumn(6)
+    column.place(0, 3, [1, 2, 3])
+    column.place(3, 3, [4, 'five', 6])
+    self.assertEqual(column.result(), [1, 2, 3, 4, 'five', 6])
+    column = asm.columns.TypedColumn(2)
+    column.place(0, 2, [1, 1 << 70])
+    self.assertEqual(column.result(), [1, 1 << 70])
+  def test_unknownLength(self):
+    column = asm.columns.TypedColumn()
+    for offset in range(0, 100, 7):
+      column.place(offset, min(7, 100 - offset), [float(i) for i in range(offset, min(offset + 7, 100))])
+    self.assertEqual(list(column.result()), [float(i) for i in range(100)])
+  @unittest.skipUnless(numpy, 'requires NumPy')
+  def test_numpyColumn(self):
+    class TaskParallelVector(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['vectors', 'names']
+      def action(self, x):
+        return numpy.array([x, 2 * x], dtype=numpy.float32), str(x)
+    parent = asm.MacroFlow() # dummy MacroFlow
+    parent.scope = {'items': list(range(100))}
+    uFlow = asm.MicroFlow(parent, num_proc=3, stream_size=16, columnar=True)
+    uFlow.append(TaskParallelVector())
+    uFlow.gather('vectors')
+    uFlow.gather('names')
+    uFlow.setup()
+    vectors, names = uFlow.action(parent.scope['items'])
+    self.assertEqual(vectors.shape, (100, 2))
+    self.assertEqual(vectors.dtype, numpy.float32)
+    self.assertEqual(vectors[:, 1].tolist(), [2.0 * x for x in range(100)])
+    self.assertEqual(names, [str(x) for x in range(100)])
+
+class TestChunkSizer(unittest.TestCase):
+  def test_adaptToItemTime(self):
+    sizer = asm.scheduler.ChunkSizer(4, target=0.1)
+    self.assertEqual(sizer.next(1000), 1)
+    sizer.update(10, 0.01)
+    self.assertEqual(sizer.next(100000), 100)
+  def test_shrinkTowardsEnd(self):
+    sizer = asm.scheduler.ChunkSizer(4, target=0.1)
+    sizer.update(10, 0.001)
+    self.assertEqual(sizer.next(80), 10)
+    self.assertEqual(sizer.next(3), 1)
+
+class TestWorkerPool(unittest.TestCase):
+  def test_poolReused(self):
+    class TaskList(bt.BaseProcessor):
+      outputs = ['items']
+      def action(self):
+        return list(range(8))
+    class TaskPid(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['pids']
+      def action(self, x):
+        return os.getpid()
+    class TaskGet(bt.BaseProcessor):
+      inputs = ['pids']
+    flow = asm.MacroFlow(num_proc=2)
+    flow.appendSerial(TaskList())
+    flow.appendParallel(TaskPid(dest=['first']))
+    flow.appendSerial(TaskGet(args=['first']))
+    flow.appendParallel(TaskPid(dest=['second']))
+    flow.appendSerial(TaskGet(args=['second']))
+    scope = flow.execute()
+    self.assertEqual(set(scope['first']), set(scope['second']))
+    self.assertEqual(len(set(scope['first'])), 2)
+    self.assertNotIn(os.getpid(), scope['first'])
+    self.assertIsNone(flow.pool)
+  def test_childProcesses(self):
+    #tasks may run processes of their own in the workers
+    class TaskParallelChild(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['codes']
+      def action(self, x):
+        child = asm.mp.Process(target=os._exit, args=(x,))
+        child.start()
+        child.join()
+        return child.exitcode
+    class TaskGet(bt.BaseProcessor):
+      inputs = ['codes']
+    flow = asm.MacroFlow(num_proc=2)
+    flow.scope['items'] = list(range(4))
+    flow.appendParallel(TaskParallelChild())
+    flow.appendSerial(TaskGet())
+    self.assertEqual(flow.execute()['codes'], [0, 1, 2, 3])
+
+  @unittest.skipUnless(os.path.isdir('/proc'), 'requires /proc')
+  def test_orphansQuit(self):
+    #the workers quit once the parent is killed, even in the middle of a job
+    class TaskParallelSlow(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['items']
+      def action(self, x):
+        time.sleep(0.05)
+        return x
+    pids = asm.mp.Queue()
+    def parent():
+      flow = asm.MacroFlow()
+      flow.scope['items'] = list(range(60))
+      uFlow = asm.MicroFlow(flow, num_proc=3)
+      uFlow.append(TaskParallelSlow())
+      uFlow.gather('items')
+      uFlow.setup()
+      pool = asm.workers.WorkerPool([uFlow], 3)
+      pids.put([process.pid for process in pool.processes])
+      flow.pool = pool
+      uFlow.action(flow.scope['items'])
+    process = asm.mp.Process(target=parent)
+    process.start()
+    workers = pids.get(timeout=10)
+    time.sleep(0.3)
+    os.kill(process.pid, 9)
+    process.join()
+    def alive(pid):
+      #(orphans may be left as zombies, if nothing reaps them)
+      try:
+        with open('/proc/{}/stat'.format(pid)) as stat:
+          return stat.read().rsplit(')', 1)[1].split()[0] != 'Z'
+      except IOError:
+        return False
+    deadline = time.time() + 10
+    while any(alive(pid) for pid in workers) and time.time() < deadline:
+      time.sleep(0.1)
+    self.assertFalse(any(alive(pid) for pid in workers))
+
+class TestTransport(unittest.TestCase):
+  def roundTrip(self, obj, codec=None, counter=None):
+    a, b = asm.mp.Pipe(True)
+    #messages larger than the pipe's buffer are only sent while received
+    sender = asm.threading.Thread(target=asm.transport.send, args=(a, obj, codec, counter))
+    sender.start()
+    result = asm.transport.recv(b, counter)
+    sender.join()
+    return result
+  def test_ordinaryObjects(self):
+    obj = {'items': [1, 2.5, 'three'], 'nested': (None, [4])}
+    self.assertEqual(self.roundTrip(obj), obj)
+  @unittest.skipUnless(asm.transport.OUT_OF_BAND, 'requires pickle protocol 5')
+  def test_sharedBuffer(self):
+    import pickle
+    data = bytearray(os.urandom(asm.transport.SHARED_THRESHOLD + 1))
+    before = set(os.listdir(asm.transport.SHARED_DIR))
+    result = self.roundTrip([pickle.PickleBuffer(data)])
+    self.assertIsInstance(result[0], asm.transport.mmap.mmap)
+    self.assertEqual(bytes(result[0]), bytes(data))
+    self.assertEqual(set(os.listdir(asm.transport.SHARED_DIR)), before)
+  @unittest.skipUnless(asm.transport.OUT_OF_BAND and numpy, 'requires NumPy and pickle protocol 5')
+  def test_sharedArray(self):
+    array = numpy.arange(asm.transport.SHARED_THRESHOLD, dtype=numpy.float32).reshape(-1, 16)
+    result = self.roundTrip({'small': array[:2].copy(), 'large': array})
+    def owner(array):
+      while isinstance(array, numpy.ndarray):
+        array = array.base
+      return array.obj if isinstance(array, memoryview) else array
+    self.assertIsInstance(owner(result['large']), asm.transport.mmap.mmap)
+    self.assertNotIsInstance(owner(result['small']), asm.transport.mmap.mmap)
+    self.assertTrue((result['large'] == array).all())
+    self.assertTrue((result['small'] == array[:2]).all())
+
+  def test_codecs(self):
+    plain = {'items': [7] * 50000 + list(range(100)), 'names': ['x'] * 100, 'pair': (1.5, None)}
+    custom = [TestTransport, set([1])]
+    for codec in ('pickle', 'marshal', 'pickle+zlib', 'marshal+lz4'):
+      counter = asm.transport.ByteCounter()
+      self.assertEqual(self.roundTrip(plain, codec, counter), plain)
+      #marshal cannot handle everything, pickle takes over then
+      self.assertEqual(self.roundTrip(custom, codec, counter), custom)
+      self.assertEqual(counter.messages, 4)
+      self.assertEqual(counter.sent, counter.received)
+      if '+' in codec:
+        #the repetitive list compresses well
+        self.assertLess(counter.sent, 100000)
+    #objects with a buffer would be marshalled as plain bytes
+    buffered = [bytearray(b'abc'), array('d', [1.5, 2.5]), {'key': (array('b', [1]),)}]
+    if numpy is not None:
+      buffered += [numpy.float64(2.0), numpy.arange(5), [numpy.int32(3)]]
+    for codec in ('marshal', 'marshal+zlib'):
+      for value in buffered:
+        received = self.roundTrip(value, codec)
+        self.assertEqual(type(received), type(value))
+        self.assertEqual(repr(received), repr(value))
+    with self.assertRaises(ValueError):
+      asm.transport.parseCodec('json')
+  def test_microFlowCodecs(self):
+    class TaskParallelSplit(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['halves']
+      codec = 'marshal+zlib'
+      def action(self, x):
+        return x / 2.0
+    class TaskParallelName(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['names']
+      def action(self, x):
+        return 'item {}'.format(x)
+    parent = asm.MacroFlow() # dummy MacroFlow
+    uFlow = asm.MicroFlow(parent, num_proc=2, stream_size=64, codec='marshal')
+    uFlow.append(TaskParallelSplit())
+    uFlow.append(TaskParallelName())
+    uFlow.gather('halves')
+    uFlow.gather('names')
+    uFlow.setup()
+    self.assertEqual(uFlow.part_codecs, [('marshal', ['names']), ('marshal+zlib', ['halves'])])
+    halves, names = uFlow.action(list(range(1000)))
+    self.assertEqual(halves, [x / 2.0 for x in range(1000)])
+    self.assertEqual(names, ['item {}'.format(x) for x in range(1000)])
+    self.assertGreater(uFlow.bytes.received, 1000)
+    self.assertIn('received', uFlow.traffic())
+    with self.assertRaises(ConstructException):
+      asm.MicroFlow(parent, codec='yaml')
+
+class TestRemoteWorkers(unittest.TestCase):
+  a = asm.Assembler('../test/tasks')
+  def test_remoteWorkers(self):
+    import socket
+    probe = socket.socket()
+    probe.bind(('localhost', 0))
+    address = 'localhost:{}'.format(probe.getsockname()[1])
+    probe.close()
+    text = ['lst (>a) 1000', 'incr (a>b) 1', 'get (b)', 'incr (b>c) 1', 'reduce_sum (c>sum)']
+    for schedule in asm.MicroFlow.schedules:
+      workers = [asm.mp.Process(target=self.a.runWorker, args=(address, 'secret')) for i in range(3)]
+      for worker in workers:
+        worker.start()
+      flow = self.a.assembleFromText(text, remote=address, remote_workers=3, authkey='secret',
+                                     schedule=schedule, tree_reduce=True)
+      scope = flow.execute()
+      self.assertEqual(scope['b'], list(range(1, 1001)))
+      self.assertEqual(scope['sum'], [501500])
+      #the workers quit along with the coordinator
+      for worker in workers:
+        worker.join(10)
+        self.assertEqual(worker.exitcode, 0)
+  def test_authkeyRequired(self):
+    with self.assertRaises(ConstructException):
+      asm.MacroFlow(remote='localhost:1')
+
+class TestConcurrentFlow(unittest.TestCase):
+  a = asm.Assembler('../test/tasks')
+  def test_dependencies(self):
+    text = ['lst (>a) 4', 'incr (a>b) 1', 'get (b)', 'incr (a>c) 2', 'get (c)', 'dup (a>a,e)']
+    flow = self.a.assembleFromText(text, 2, concurrent=True)
+    self.assertEqual(flow.getDependencies(), [[], [0], [1], [0], [3], [0, 1, 3]])
+    scope = flow.execute()
+    self.assertEqual(scope['b'], [1, 2, 3, 4])
+    self.assertEqual(scope['c'], [2, 3, 4, 5])
+    self.assertEqual(scope['e'], [0, 1, 2, 3])
+  def test_concurrentResults(self):
+    expected_b = [1, 2, 3, 4]
+    expected_d = [2, 6, 12, 20]
+    text = ['lst (>a) 4', 'incr (a>b) 1', 'get (b)', 'incr (a>c) 2', 'vmul (b,c>d)','get (d)']
+    flow = self.a.assembleFromText(text, 2, concurrent=True)
+    flow.execute()
+    self.assertEqual(flow.scope['b'], expected_b)
+    self.assertEqual(flow.scope['d'], expected_d)
+  def test_independentOverlap(self):
+    class TaskSleep(bt.BaseProcessor):
+      outputs = ['item']
+      def action(self):
+        time.sleep(0.3)
+        return time.time()
+    flow = asm.MacroFlow(concurrent=True)
+    flow.appendSerial(TaskSleep(dest=['first']))
+    flow.appendSerial(TaskSleep(dest=['second']))
+    start = time.time()
+    scope = flow.execute()
+    self.assertLess(time.time() - start, 0.5)
+    self.assertLess(abs(scope['first'] - scope['second']), 0.1)
+
+class TestScopeLiveness(unittest.TestCase):
+  a = asm.Assembler('../test/tasks')
+  text = ['lst (>a) 4', 'incr (a>b) 1', 'get (b)', 'incr (a>c) 2', 'vmul (b,c>d)', 'get (d)']
+  def test_iteratorReadTwice(self):
+    #a generator read by more than one task is turned into a list first
+    class TaskGenerate(bt.BaseProcessor):
+      outputs = ['items']
+      def action(self):
+        return (x for x in range(10))
+    class TaskParallelIncrement(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['items']
+      def action(self, x):
+        return x + 1
+    class TaskGet(bt.BaseProcessor):
+      inputs = ['items']
+    for concurrent in (False, True):
+      flow = asm.MacroFlow(num_proc=2, concurrent=concurrent)
+      flow.appendSerial(TaskGenerate())
+      flow.appendParallel(TaskParallelIncrement(args=['items'], dest=['a']))
+      flow.appendSerial(TaskGet(args=['a']))
+      flow.appendParallel(TaskParallelIncrement(args=['items'], dest=['b']))
+      flow.appendSerial(TaskGet(args=['b']))
+      scope = flow.execute()
+      self.assertEqual(scope['a'], list(range(1, 11)))
+      self.assertEqual(scope['b'], list(range(1, 11)))
+  def test_lifetimes(self):
+    flow = self.a.assembleFromText(self.text, 2, keep=['d'])
+    self.assertEqual(sorted(flow.lifetimes), [('a', set([1, 3])), ('b', set([2, 3]))])
+  def test_inPlace(self):
+    flow = self.a.assembleFromText(['src 1', 'add 1', 'dup (item>item,x)', 'get (item)'])
+    self.assertEqual(flow.lifetimes, [('item', set([3]))])
+  def test_freeDead(self):
+    for concurrent in (False, True):
+      flow = self.a.assembleFromText(self.text, 2, free_dead=True, concurrent=concurrent, keep=['d'])
+      scope = flow.execute()
+      self.assertEqual(list(scope.keys()), ['d'])
+      self.assertEqual(scope['d'], [2, 6, 12, 20])
+  def test_keepByDefault(self):
+    flow = self.a.assembleFromText(self.text, 2)
+    scope = flow.execute()
+    self.assertEqual(sorted(scope.keys()), ['a', 'b', 'd'])
+
+class TestSpill(unittest.TestCase):
+  a = asm.Assembler('../test/tasks')
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+  def tearDown(self):
+    shutil.rmtree(self.path)
+  def test_spilledList(self):
+    import pickle
+    values = [{'id': i, 'name': 'item {}'.format(i)} for i in range(1000)]
+    spilled = asm.spill.Spiller(self.path).spill(values)
+    self.assertIsInstance(spilled, asm.spill.SpilledList)
+    self.assertEqual(len(spilled), 1000)
+    self.assertEqual(spilled[10], values[10])
+    self.assertEqual(spilled[-1], values[-1])
+    self.assertEqual(spilled[5:500:7], values[5:500:7])
+    self.assertEqual(list(spilled), values)
+    self.assertEqual(pickle.loads(pickle.dumps(spilled)), values)
+    #nothing is left behind in the folder
+    self.assertEqual(os.listdir(self.path), [])
+  def test_enforceBudget(self):
+    scope = {'large': list(range(200000)), 'small': list(range(10)), 'text': 'x' * 100}
+    spiller = asm.spill.Spiller(self.path, budget=1 << 20)
+    self.assertEqual(spiller.enforce(scope), ['large'])
+    self.assertIsInstance(scope['large'], asm.spill.SpilledList)
+    self.assertEqual(scope['large'][199999], 199999)
+    self.assertEqual(scope['small'], list(range(10)))
+    #once spilled, the items no longer count
+    self.assertEqual(spiller.enforce(scope), [])
+  @unittest.skipUnless(numpy, 'requires NumPy')
+  def test_spilledArray(self):
+    scope = {'array': numpy.arange(300000, dtype=numpy.float64).reshape(-1, 3)}
+    asm.spill.Spiller(self.path, budget=0).enforce(scope)
+    self.assertIsInstance(scope['array'], numpy.memmap)
+    self.assertEqual(scope['array'].shape, (100000, 3))
+    self.assertEqual(scope['array'][-1].tolist(), [299997.0, 299998.0, 299999.0])
+  def test_spillGathered(self):
+    text = ['lst (>a) 50000', 'incr (a>b) 1', 'incr (b>c) 1', 'get (b)', 'get (c)']
+    flow = self.a.assembleFromText(text, 2, spill_dir=self.path, memory_budget=0)
+    scope = flow.execute()
+    #the input of the MicroFlow was spilled too, and read from the disk
+    for item, offset in (('a', 0), ('b', 1), ('c', 2)):
+      self.assertIsInstance(scope[item], asm.spill.SpilledList)
+      self.assertEqual(list(scope[item]), [i + offset for i in range(50000)])
+
+class TestPipeline(unittest.TestCase):
+  def test_streamOrder(self):
+    stream = asm.pipeline.Stream(['a', 'b'], depth=1)
+    parts = [(offset, 10, {'a': list(range(offset, offset + 10)), 'b': [offset] * 10})
+             for offset in range(0, 50, 10)]
+    def produce():
+      #parts come in any order, and may be split
+      for offset, count, output in reversed(parts):
+        stream.put(offset, count, {'a': output['a']})
+        stream.put(offset, count, {'b': output['b']})
+      stream.close()
+    producer = asm.threading.Thread(target=produce)
+    producer.start()
+    pairs = list(zip(stream.iterate('a'), stream.iterate('b')))
+    producer.join()
+    self.assertEqual(pairs, [(i, i - i % 10) for i in range(50)])
+  def test_backpressure(self):
+    stream = asm.pipeline.Stream(['a'], depth=2)
+    def produce():
+      for offset in range(0, 100, 10):
+        stream.put(offset, 10, {'a': list(range(offset, offset + 10))})
+      stream.close()
+    producer = asm.threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+    #the producer is held back until the reader takes the parts
+    time.sleep(0.2)
+    self.assertTrue(producer.is_alive())
+    self.assertEqual(stream.queue.qsize(), 2)
+    values = stream.iterate('a')
+    self.assertEqual([next(values) for i in range(5)], list(range(5)))
+    stream.drain()
+    producer.join()
+    #a failed reader releases the producer
+    stream = asm.pipeline.Stream(['a'], depth=1)
+    stream.put(0, 1, {'a': [0]})
+    stream.abandon()
+    with self.assertRaises(asm.pipeline.StreamAbandoned):
+      stream.put(1, 1, {'a': [1]})
+  def test_pipelinedFlow(self):
+    class TaskParallelSquare(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['squares', 'cubes']
+      def action(self, x):
+        return x * x, x * x * x
+    class TaskStreamSum(bt.BaseProcessor):
+      inputs = ['squares', 'cubes']
+      outputs = ['total', 'kinds']
+      streaming = True
+      def action(self, squares, cubes):
+        total = sum(s + c for s, c in zip(squares, cubes))
+        return total, (type(squares).__name__, type(cubes).__name__)
+    class TaskGet(bt.BaseProcessor):
+      inputs = ['cubes']
+      outputs = ['last']
+      def action(self, cubes):
+        return cubes[-1]
+    for schedule in asm.MicroFlow.schedules:
+      flow = asm.MacroFlow(num_proc=3, schedule=schedule, stream_size=16, pipeline=True,
+                           pipeline_depth=2)
+      flow.scope['items'] = list(range(1000))
+      flow.appendParallel(TaskParallelSquare())
+      flow.appendSerial(TaskStreamSum())
+      flow.appendSerial(TaskGet())
+      scope = flow.execute()
+      self.assertEqual(scope['total'], sum(x * x + x * x * x for x in range(1000)))
+      self.assertEqual(scope['kinds'], ('generator', 'generator'))
+      #only the outputs read by later tasks are kept
+      self.assertNotIn('squares', scope)
+      self.assertEqual(scope['cubes'], [x * x * x for x in range(1000)])
+      self.assertEqual(scope['last'], 999 ** 3)
+
+class TestResultCache(unittest.TestCase):
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+  def tearDown(self):
+    shutil.rmtree(self.path)
+  def test_serialCached(self):
+    calls = []
+    class TaskSource(bt.BaseProcessor):
+      outputs = ['item']
+      def action(self):
+        return 5
+    class TaskCounted(bt.BaseProcessor):
+      params = [('const', int)]
+      inputs = ['item']
+      outputs = ['item']
+      def action(self, item):
+        calls.append(item)
+        return item + self.const
+    for const, expected_calls in (('1', 1), ('1', 1), ('2', 2)):
+      flow = asm.MacroFlow(cache_dir=self.path)
+      flow.appendSerial(TaskSource())
+      flow.appendSerial(TaskCounted(params=[const]))
+      self.assertEqual(flow.execute()['item'], 5 + int(const))
+      self.assertEqual(len(calls), expected_calls)
+  def test_serialTrimmed(self):
+    class TaskLarge(bt.BaseProcessor):
+      params = [('seed', int)]
+      outputs = ['blob']
+      def action(self):
+        return str(self.seed) * 400000
+    for seed in range(5):
+      flow = asm.MacroFlow(cache_dir=self.path, cache_size=1 << 20)
+      flow.appendSerial(TaskLarge(params=[str(seed)]))
+      flow.execute()
+      stored = sum(os.path.getsize(os.path.join(folder, name))
+                   for folder, _, names in os.walk(self.path) for name in names)
+      self.assertLessEqual(stored, 1 << 20)
+  def test_sinkNotCached(self):
+    #a task without outputs is run for its side effects, every time
+    written = []
+    class TaskSource(bt.BaseProcessor):
+      outputs = ['item']
+      def action(self):
+        return 5
+    class TaskWrite(bt.BaseProcessor):
+      inputs = ['item']
+      def action(self, item):
+        written.append(item)
+    for run in range(2):
+      flow = asm.MacroFlow(cache_dir=self.path)
+      flow.appendSerial(TaskSource())
+      flow.appendSerial(TaskWrite())
+      flow.execute()
+    self.assertEqual(written, [5, 5])
+  def test_itemsCached(self):
+    class TaskPid(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['doubled', 'pids']
+      def action(self, x):
+        return x * 2, os.getpid()
+    class TaskGet(bt.BaseProcessor):
+      inputs = ['doubled', 'pids']
+    def run(data):
+      flow = asm.MacroFlow(num_proc=2, cache_dir=self.path)
+      flow.scope['items'] = data
+      flow.appendParallel(TaskPid())
+      flow.appendSerial(TaskGet())
+      scope = flow.execute()
+      return scope['doubled'], scope['pids']
+    items1, pids1 = run([1, 2, 3, 4])
+    items2, pids2 = run([1, 2, 3, 5])
+    self.assertEqual(items1, [2, 4, 6, 8])
+    self.assertEqual(items2, [2, 4, 6, 10])
+    #the first three items come from the cache, computed by the first pool
+    self.assertEqual(pids2[:3], pids1[:3])
+    self.assertNotIn(pids2[3], pids1)
+  def test_evictLeastRecent(self):
+    store = asm.cache.ResultCache(self.path, max_size=2500)
+    for key in ('aa1', 'aa2', 'aa3'):
+      store.put(key, b'x' * 1000)
+      time.sleep(0.01)
+    store.get('aa1')
+    store.trim()
+    self.assertTrue(store.get('aa1')[0])
+    self.assertFalse(store.get('aa2')[0])
+    self.assertTrue(store.get('aa3')[0])
+
+class TestCheckpoint(unittest.TestCase):
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+  def tearDown(self):
+    shutil.rmtree(self.path)
+  def makeFlow(self, calls, fail):
+    class TaskSource(bt.BaseProcessor):
+      outputs = ['item']
+      def action(self):
+        calls.append('source')
+        return 5
+    class TaskFail(bt.BaseProcessor):
+      inputs = ['item']
+      outputs = ['item']
+      def action(self, item):
+        if fail:
+          raise RuntimeError('interrupted')
+        return item + 1
+    flow = asm.MacroFlow(checkpoint_dir=self.path, resume=True)
+    flow.appendSerial(TaskSource())
+    flow.appendSerial(TaskFail())
+    return flow
+  def test_resumeSkipsDone(self):
+    calls = []
+    self.assertRaises(RuntimeError, self.makeFlow(calls, True).execute)
+    self.assertEqual(self.makeFlow(calls, False).execute()['item'], 6)
+    self.assertEqual(calls, ['source'])
+  def test_partsReused(self):
+    class TaskDouble(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['doubled']
+      def action(self, x):
+        return x * 2
+    class TaskGet(bt.BaseProcessor):
+      inputs = ['doubled']
+    flow = asm.MacroFlow(num_proc=2, checkpoint_dir=self.path, resume=True)
+    flow.scope['items'] = list(range(6))
+    flow.appendParallel(TaskDouble())
+    flow.appendSerial(TaskGet())
+    #pretend that an interrupted run has already processed the first two items
+    stored = asm.checkpoint.Checkpoint(self.path)
+    stored.start(flow.tasks)
+    stored.savePart(0, 0, 2, {'doubled': ['a', 'b']})
+    self.assertEqual(flow.execute()['doubled'], ['a', 'b', 4, 6, 8, 10])
+  def test_partsSplitByCodec(self):
+    class TaskParallelHalf(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['halves']
+      codec = 'marshal'
+      fail = True
+      def action(self, x):
+        if self.fail and x == 80:
+          raise ValueError('interrupted')
+        return x / 2.0
+    class TaskParallelName(bt.BaseParallel):
+      inputs = ['items']
+      outputs = ['names']
+      def action(self, x):
+        return 'item {}'.format(x)
+    class TaskGet(bt.BaseProcessor):
+      inputs = ['halves', 'names']
+    def run():
+      flow = asm.MacroFlow(num_proc=2, schedule='dynamic', stream_size=4,
+                           checkpoint_dir=self.path, resume=True)
+      flow.scope['items'] = list(range(100))
+      flow.appendParallel(TaskParallelHalf())
+      flow.appendParallel(TaskParallelName())
+      flow.appendSerial(TaskGet())
+      return flow.execute()
+    self.assertRaises(WorkerException, run)
+    #every part is stored whole, although each was sent in two messages
+    parts = asm.checkpoint.Checkpoint(self.path).loadParts(0)
+    self.assertGreater(len(parts), 0)
+    for offset, count, output in parts:
+      self.assertEqual(sorted(output.keys()), ['halves', 'names'])
+    TaskParallelHalf.fail = False
+    scope = run()
+    self.assertEqual(scope['halves'], [x / 2.0 for x in range(100)])
+    self.assertEqual(scope['names'], ['item {}'.format(x) for x in range(100)])
+  def test_foreignFiles(self):
+    #files and folders the checkpoint did not write are left alone
+    os.makedirs(os.path.join(self.path, 'tasks'))
+    with open(os.path.join(self.path, 'tasklist.txt'), 'w') as other:
+      other.write('keep me')
+    stored = asm.checkpoint.Checkpoint(self.path)
+    stored.start([])
+    stored.savePart(1, 0, 1, {'item': [1]})
+    stored.start([])
+    self.assertEqual(sorted(os.listdir(self.path)), ['manifest.pkl', 'tasklist.txt', 'tasks'])
+  def test_differentScript(self):
+    self.assertRaises(RuntimeError, self.makeFlow([], True).execute)
+    flow = self.makeFlow([], False)
+    flow.tasks.pop()
+    self.assertRaises(CheckpointException, flow.execute)
+
+class TestTrace(unittest.TestCase):
+  a = asm.Assembler('../test/tasks')
+  def test_traceFile(self):
+    path = tempfile.mkdtemp()
+    try:
+      trace_file = os.path.join(path, 'trace.json')
+      text = ['lst 50', 'incr (item>plus1) 1', 'dup(plus1>a,b)']
+      flow = self.a.assembleFromText(text, 2, trace_file=trace_file)
+      flow.execute()
+      with open(trace_file) as stored:
+        events = json.load(stored)['traceEvents']
+    finally:
+      shutil.rmtree(path)
+    spans = [e for e in events if e['ph'] == 'X']
+    names = [e['args']['name'] for e in events if e['ph'] == 'M']
+    self.assertIn('lst', [e['name'] for e in spans if e['cat'] == 'task'])
+    #every worker reports the time of the parallel task on its chunk
+    workers = [e for e in spans if e['cat'] == 'parallel' and e['name'] == 'incr']
+    self.assertEqual(len(set(e['pid'] for e in workers)), 2)
+    self.assertEqual(sum(e['args']['items'] for e in workers), 50)
+    self.assertNotIn(os.getpid(), [e['pid'] for e in workers])
+    self.assertEqual(sorted(names), ['muFlow', 'muFlow worker', 'muFlow worker'])
+    #the workers do not send back what the parent recorded before forking them
+    self.assertEqual([e['pid'] for e in spans if e['name'] == 'setup'], [os.getpid()])
+
+class TestOptimizer(unittest.TestCase):
+  a = asm.Assembler('../test/tasks')
+  text = ['lst (>a) 4', 'incr (a>b) 1', 'src (>c) 5', 'add (c>c) 1',
+          'incr (a>d) 2', 'vmul (b,d>e)', 'get (e)']
+  def countMicros(self, flow):
+    return len([task for task in flow.tasks if isinstance(task, asm.MicroFlow)])
+  def test_fuseMicroFlows(self):
+    plain = self.a.assembleFromText(self.text)
+    optimized = self.a.assembleFromText(self.text, optimize=True)
+    self.assertEqual(self.countMicros(plain), 2)
+    self.assertEqual(self.countMicros(optimized), 1)
+    self.assertEqual(optimized.execute()['e'], plain.execute()['e'])
+    self.assertEqual(optimized.scope['c'], 6)
+  def test_keepDependentOrder(self):
+    #the serial task changes the input of the second parallel task
+    text = ['lst (>a) 4', 'incr (a>b) 1', 'add (a>a) 1', 'incr (a>d) 2', 'get (b)', 'get (d)']
+    flow = self.a.assembleFromText(text, optimize=True)
+    self.assertEqual(self.countMicros(flow), 2)
+  def test_unrelatedNotFused(self):
+    #lists of different lengths cannot be processed by one MicroFlow
+    text = ['lst (>a) 4', 'incr (a>b) 1', 'lst (>c) 3', 'incr (c>d) 2', 'get (b)', 'get (d)']
+    flow = self.a.assembleFromText(text, optimize=True)
+    self.assertEqual(self.countMicros(flow), 2)
+    self.assertEqual(flow.execute()['d'], [2, 3, 4])
+  def test_dropDead(self):
+    flow = self.a.assembleFromText(self.text, optimize=True, keep=['e'])
+    self.assertEqual([task.name for _, task in flow.dropped], ['src', 'add'])
+    self.assertNotIn('c', flow.execute())
+    #without the final outputs given, only the overwritten values are dead
+    text = ['src (>c) 1', 'src (>c) 2', 'get (c)']
+    flow = self.a.assembleFromText(text, optimize=True)
+    self.assertEqual(len(flow.dropped), 1)
+    self.assertEqual(flow.execute()['c'], 2)
 
 class TestAssemblerParallel(unittest.TestCase):
   a = asm.Assembler('../test/tasks')
@@ -181,6 +1258,48 @@ class TestReduction(unittest.TestCase):
     flow = self.a.assembleFromText(text, 8)
     flow.execute()
     self.assertEqual(flow.scope['sum'], expected)
+  def test_reductionDynamic(self):
+    expected = [500500]
+    text = ['lst 1001', 'reduce_sum (item>sum)']
+    flow = self.a.assembleFromText(text, 4, schedule='dynamic')
+    flow.execute()
+    self.assertEqual(flow.scope['sum'], expected)
+  def test_reductionTree(self):
+    expected = [500500]
+    text = ['lst 1001', 'reduce_sum (item>sum)']
+    for num_proc, schedule in ((8, 'static'), (5, 'dynamic'), (1, 'static')):
+      flow = self.a.assembleFromText(text, num_proc, schedule=schedule, tree_reduce=True)
+      flow.execute()
+      self.assertEqual(flow.scope['sum'], expected)
+  def test_reductionInplace(self):
+    class ReduceAdd(bt.BaseReducer):
+      name = 'vadd'
+      inplace = True
+      def reduction(self, a, b):
+        for i, x in enumerate(a):
+          b[i] += x
+        return b
+    items = [[i, 2 * i] for i in range(10)]
+    flow = asm.MacroFlow(num_proc=3, tree_reduce=True)
+    flow.scope['item'] = items
+    flow.appendReducer(ReduceAdd(dest=['total']))
+    flow.completeParallel()
+    self.assertEqual(flow.execute()['total'], [[45, 90]])
+    self.assertEqual(items[0], [0, 0])
+  def test_reductionThreads(self):
+    expected = [500500]
+    text = ['lst 1001', 'reduce_sum (item>sum)']
+    for backend in ('thread', 'hybrid'):
+      for tree_reduce in (False, True):
+        flow = self.a.assembleFromText(text, 3, backend=backend, threads=4, tree_reduce=tree_reduce)
+        flow.execute()
+        self.assertEqual(flow.scope['sum'], expected)
+  def test_reductionIdleProcess(self):
+    expected = [10]
+    text = ['lst 5', 'reduce_sum (item>sum)']
+    flow = self.a.assembleFromText(text, 8)
+    flow.execute()
+    self.assertEqual(flow.scope['sum'], expected)
 
 if __name__=="__main__":
   print("Running assembler tests...")
@@ -0,0 +1,25 @@
+#Tasks with coroutine actions, for the tests of assembler - imported only on
+#Python 3.5+, as older versions cannot even compile them
+import asyncio
+
+import baseTasks as bt
+
+class TaskAsyncFetch(bt.BaseParallel):
+  inputs = ['items']
+  outputs = ['fetched', 'active']
+  running = 0
+  async def action(self, x):
+    self.running += 1
+    active = self.running
+    #later items finish first
+    await asyncio.sleep(0.001 * (x % 7))
+    self.running -= 1
+    return x * 2, active
+
+class TaskAsyncInverse(bt.BaseParallel):
+  name = 'inverse'
+  inputs = ['items']
+  outputs = ['inverses']
+  skip_errors = True
+  async def action(self, x):
+    return 1.0 / (x % 100 - 37)